@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def synchronous_thumbnails(settings):
+    # Поток пула миниатюр мог бы писать во временный MEDIA_ROOT, который
+    # фикстура mock_media уже удаляет: в тестах миниатюры готовятся сразу.
+    settings.THUMBNAIL_WORKERS = 0
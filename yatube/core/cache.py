@@ -0,0 +1,301 @@
+import pickle
+import sqlite3
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from core.sqlite import LocalConnection
+
+
+# SQLite ограничивает число параметров запроса.
+CHUNK_SIZE: int = 500
+
+_MISSING = object()
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite в режиме WAL, общий для процессов одной машины.
+
+    LOCATION — путь к файлу. Целые числа хранятся как INTEGER, поэтому
+    incr атомарен между процессами; остальное — pickle. Когда записей
+    больше MAX_ENTRIES, вытесняется каждая CULL_FREQUENCY-я из давно
+    не читанных.
+    """
+
+    # Время последнего чтения обновляется не чаще раза в столько секунд:
+    # для вытеснения этого хватает, а чтения не превращаются в записи.
+    ACCESS_RESOLUTION = 10
+    # Как часто (в записях процесса) проверять размер таблицы.
+    CULL_EVERY = 100
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        self._db = LocalConnection(
+            location,
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value BLOB, '
+            'expires REAL, accessed REAL NOT NULL)',
+            'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+        )
+        self._writes = 0
+
+    def _write(self, sql, params=()):
+        with self._db.transaction() as connection:
+            return connection.execute(sql, params)
+
+    @staticmethod
+    def _dump(value):
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _fetch(self, keys):
+        """{ключ: значение} для живых записей из keys."""
+        now = time.time()
+        found, stale = {}, []
+        connection = self._db.get()
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            rows = connection.execute(
+                'SELECT key, value, expires, accessed FROM cache '
+                'WHERE key IN ({})'.format(', '.join('?' * len(chunk))),
+                chunk
+            )
+            for key, value, expires, accessed in rows:
+                if expires is not None and expires <= now:
+                    continue
+                found[key] = self._load(value)
+                if accessed < now - self.ACCESS_RESOLUTION:
+                    stale.append(key)
+        if stale:
+            self._touch_accessed(stale, now)
+        return found
+
+    def _touch_accessed(self, keys, now):
+        connection = self._db.get()
+        try:
+            connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                [(now, key) for key in keys]
+            )
+        except sqlite3.OperationalError:
+            # Занятая база не повод проваливать чтение.
+            pass
+
+    def _store(self, items, timeout):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        with self._db.transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires, accessed)'
+                ' VALUES (?, ?, ?, ?)',
+                [(key, self._dump(value), expires, now)
+                 for key, value in items]
+            )
+        self._writes += len(items)
+        if self._writes >= self.CULL_EVERY:
+            self._writes = 0
+            self._cull()
+
+    def _cull(self):
+        now = time.time()
+        self._write('DELETE FROM cache WHERE expires <= ?', (now,))
+        count, = self._db.get().execute(
+            'SELECT COUNT(*) FROM cache'
+        ).fetchone()
+        if count > self._max_entries:
+            excess = count - self._max_entries
+            if self._cull_frequency:
+                excess = max(excess, count // self._cull_frequency)
+            self._write(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (excess,)
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._fetch([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        return {
+            keys[key]: value
+            for key, value in self._fetch(list(keys)).items()
+        }
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return key in self._fetch([key])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store([(self._key(key, version), value)], timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store(
+            [(self._key(key, version), value) for key, value in data.items()],
+            timeout
+        )
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._db.transaction() as connection:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now)
+            )
+            return connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires, accessed)'
+                ' VALUES (?, ?, ?, ?)',
+                (key, self._dump(value), self.get_backend_timeout(timeout),
+                 now)
+            ).rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно прибавляет delta; ValueError, если ключа нет."""
+        key = self._key(key, version)
+        with self._db.transaction() as connection:
+            row = connection.execute(
+                'SELECT value, expires FROM cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or (
+                row[1] is not None and row[1] <= time.time()
+            ):
+                raise ValueError("Key '%s' not found" % key)
+            value = self._load(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (self._dump(value), key)
+            )
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        return self._write(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time())
+        ).rowcount == 1
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            self._write(
+                'DELETE FROM cache WHERE key IN ({})'.format(
+                    ', '.join('?' * len(chunk))
+                ),
+                chunk
+            )
+
+    def clear(self):
+        self._write('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Django закрывает кэши после каждого запроса; соединение потока
+        # переиспользуется, открывать его заново дороже.
+        pass
+
+
+class TieredSQLiteCache(SQLiteCache):
+    """SQLiteCache с небольшим L1 в памяти процесса перед ним.
+
+    Прочитанное из L2 запоминается в L1 на L1_TIMEOUT секунд, поэтому
+    изменения из других процессов видны с такой задержкой. Записи,
+    incr и удаления идут в оба уровня.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        options = params.get('OPTIONS', {})
+        self.l1_timeout = options.get('L1_TIMEOUT', 2)
+        self.l1 = LocMemCache(f'tiered-l1:{location}', {
+            'TIMEOUT': self.l1_timeout,
+            'OPTIONS': {
+                'MAX_ENTRIES': options.get('L1_MAX_ENTRIES', 1000),
+            },
+        })
+
+    def _l1_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def get(self, key, default=None, version=None):
+        value = self.l1.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            value = super().get(key, _MISSING, version=version)
+            if value is _MISSING:
+                return default
+            self.l1.set(key, value, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = self.l1.get_many(keys, version=version)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            fetched = super().get_many(missing, version=version)
+            self.l1.set_many(fetched, version=version)
+            found.update(fetched)
+        return found
+
+    def has_key(self, key, version=None):
+        return (self.l1.has_key(key, version=version)
+                or super().has_key(key, version=version))
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        super().set(key, value, timeout, version=version)
+        self.l1.set(key, value, self._l1_timeout(timeout), version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        super().set_many(data, timeout, version=version)
+        self.l1.set_many(data, self._l1_timeout(timeout), version=version)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = super().add(key, value, timeout, version=version)
+        # Ключ мог быть уже занят другим процессом: его значение L1
+        # подтянет при следующем чтении.
+        self.l1.delete(key, version=version)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        value = super().incr(key, delta, version=version)
+        self.l1.set(key, value, version=version)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l1.delete(key, version=version)
+        return super().touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.l1.delete(key, version=version)
+        super().delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        self.l1.delete_many(keys, version=version)
+        super().delete_many(keys, version=version)
+
+    def clear(self):
+        self.l1.clear()
+        super().clear()
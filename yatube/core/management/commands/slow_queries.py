@@ -0,0 +1,63 @@
+import textwrap
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import slow_queries
+
+
+class Command(BaseCommand):
+    help = (
+        'Печатает самые тяжёлые формы запросов из журнала медленных '
+        'запросов (SLOW_QUERY_LOG).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=10, help='Сколько форм показать.'
+        )
+        parser.add_argument(
+            '--order-by',
+            choices=list(slow_queries.ORDERINGS),
+            default='total',
+            help='Сортировка: суммарное, число, максимальное или среднее.'
+        )
+        parser.add_argument(
+            '--plans',
+            action='store_true',
+            help='Показывать EXPLAIN QUERY PLAN и образец запроса.'
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Очистить журнал после вывода.'
+        )
+
+    def handle(self, *args, **options):
+        log = slow_queries.get_log()
+        if log is None:
+            raise CommandError('Журнал выключен: задайте SLOW_QUERY_LOG.')
+        entries = log.top(options['limit'], options['order_by'])
+        self.stdout.write(
+            f'{"раз":>6} {"всего, мс":>10} {"макс, мс":>9} '
+            f'{"средн, мс":>9}  маршрут / отпечаток'
+        )
+        for entry in entries:
+            self.stdout.write(
+                f'{entry["count"]:>6} {entry["total_ms"]:>10.1f} '
+                f'{entry["max_ms"]:>9.1f} '
+                f'{entry["total_ms"] / entry["count"]:>9.1f}  '
+                f'{entry["view"]} / {entry["fingerprint"]}'
+            )
+            self.stdout.write(textwrap.indent(
+                textwrap.shorten(entry['shape'], 300), ' ' * 8
+            ))
+            if options['plans']:
+                self.stdout.write(textwrap.indent(
+                    entry['plan'] or '(плана нет)', ' ' * 8 + '| '
+                ))
+                self.stdout.write(textwrap.indent(
+                    entry['sample'], ' ' * 8 + '> '
+                ))
+        if options['reset']:
+            log.reset()
+            self.stdout.write(self.style.SUCCESS('Журнал очищен.'))
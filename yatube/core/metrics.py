@@ -0,0 +1,266 @@
+import atexit
+import bisect
+import json
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import get_resolver
+
+from core import timing
+from core.sqlite import LocalConnection
+
+
+# Границы корзин гистограмм: секунды ответа и число запросов к БД.
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+HISTOGRAMS = {
+    'yatube_request_duration_seconds': (
+        'Время ответа по маршруту и статусу.', DURATION_BUCKETS
+    ),
+    'yatube_db_queries': (
+        'Число запросов к БД за запрос по маршруту.', QUERY_BUCKETS
+    ),
+}
+COUNTERS = {
+    'yatube_cache_requests_total': (
+        'Чтения из кэша по маршруту и результату (hit, miss).'
+    ),
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class MetricsStore:
+    """Счётчики метрик в файле SQLite, общем для процессов машины.
+
+    Процесс копит приращения в памяти и сбрасывает их одной
+    транзакцией раз в FLUSH_INTERVAL секунд, перед чтением и при
+    выходе. Сброс по таймеру не ждёт следующего inc, так что и
+    простаивающие процессы видны с задержкой не больше FLUSH_INTERVAL.
+    """
+
+    FLUSH_INTERVAL = 1
+
+    def __init__(self, location):
+        self.location = location
+        self._db = LocalConnection(
+            location,
+            'CREATE TABLE IF NOT EXISTS samples ('
+            'metric TEXT, labels TEXT, bucket TEXT, value REAL, '
+            'PRIMARY KEY (metric, labels, bucket))',
+        )
+        self._lock = threading.Lock()
+        self._pending = defaultdict(float)
+        self._flushed = time.monotonic()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def inc(self, metric, labels, value=1, bucket=''):
+        key = (metric, json.dumps(labels, sort_keys=True), bucket)
+        with self._lock:
+            self._pending[key] += value
+            due = time.monotonic() - self._flushed >= self.FLUSH_INTERVAL
+            if not due and not (self._timer and self._timer.is_alive()):
+                self._timer = threading.Timer(
+                    self.FLUSH_INTERVAL, self.flush
+                )
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def observe(self, metric, labels, value):
+        """Наблюдение гистограммы: корзина, сумма и число."""
+        buckets = HISTOGRAMS[metric][1]
+        index = bisect.bisect_left(buckets, value)
+        le = str(buckets[index]) if index < len(buckets) else '+Inf'
+        self.inc(metric, labels, 1, le)
+        self.inc(metric, labels, value, 'sum')
+        self.inc(metric, labels, 1, 'count')
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+            self._flushed = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        with self._db.transaction() as connection:
+            connection.executemany(
+                'INSERT INTO samples (metric, labels, bucket, value) '
+                'VALUES (?, ?, ?, ?) ON CONFLICT (metric, labels, bucket) '
+                'DO UPDATE SET value = value + excluded.value',
+                [(*key, value) for key, value in pending.items()]
+            )
+
+    def close(self):
+        """Сбрасывает накопленное; хранилище больше не используется."""
+        atexit.unregister(self.flush)
+        self.flush()
+
+    def collect(self):
+        """{метрика: {labels: {корзина: значение}}} всех процессов.
+
+        Сначала сбрасывает накопленное самим процессом: свежие
+        приращения видны в /metrics сразу, без ожидания таймера.
+        """
+        self.flush()
+        samples = defaultdict(lambda: defaultdict(dict))
+        for metric, labels, bucket, value in self._db.get().execute(
+            'SELECT metric, labels, bucket, value FROM samples'
+        ):
+            samples[metric][labels][bucket] = value
+        return samples
+
+
+def get_store():
+    """Хранилище из settings.METRICS_DATABASE или None, если выключено."""
+    global _store
+    with _store_lock:
+        if _store is None and settings.METRICS_DATABASE:
+            _store = MetricsStore(settings.METRICS_DATABASE)
+        return _store
+
+
+@receiver(setting_changed)
+def _metrics_database_changed(setting, **kwargs):
+    global _store
+    if setting == 'METRICS_DATABASE':
+        with _store_lock:
+            if _store is not None:
+                _store.close()
+            _store = None
+
+
+def _number(value):
+    return f'{value:g}' if value != int(value) else str(int(value))
+
+
+def _format_labels(labels, **extra):
+    labels = {**json.loads(labels), **extra}
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    ) + '}'
+
+
+def render(samples):
+    """Метрики в текстовом формате Prometheus."""
+    lines = []
+    durations = samples.get('yatube_request_duration_seconds', {})
+    lines += [
+        '# HELP yatube_requests_total Запросы по маршруту и статусу.',
+        '# TYPE yatube_requests_total counter',
+    ]
+    for labels, values in sorted(durations.items()):
+        lines.append(
+            f'yatube_requests_total{_format_labels(labels)} '
+            f'{_number(values.get("count", 0))}'
+        )
+    for metric, (description, buckets) in HISTOGRAMS.items():
+        lines += [
+            f'# HELP {metric} {description}',
+            f'# TYPE {metric} histogram',
+        ]
+        for labels, values in sorted(samples.get(metric, {}).items()):
+            total = 0
+            for le in [*map(str, buckets), '+Inf']:
+                total += values.get(le, 0)
+                lines.append(
+                    f'{metric}_bucket{_format_labels(labels, le=le)} '
+                    f'{_number(total)}'
+                )
+            lines.append(
+                f'{metric}_sum{_format_labels(labels)} '
+                f'{_number(values.get("sum", 0))}'
+            )
+            lines.append(
+                f'{metric}_count{_format_labels(labels)} '
+                f'{_number(values.get("count", 0))}'
+            )
+    for metric, description in COUNTERS.items():
+        lines += [
+            f'# HELP {metric} {description}',
+            f'# TYPE {metric} counter',
+        ]
+        for labels, values in sorted(samples.get(metric, {}).items()):
+            lines.append(
+                f'{metric}{_format_labels(labels)} {_number(values[""])}'
+            )
+    lines += [
+        '# HELP yatube_cache_hit_ratio Доля попаданий в кэш по маршруту.',
+        '# TYPE yatube_cache_hit_ratio gauge',
+    ]
+    ratios = defaultdict(lambda: [0, 0])
+    for labels, values in samples.get(
+        'yatube_cache_requests_total', {}
+    ).items():
+        labels = json.loads(labels)
+        ratios[labels['view']][labels['result'] == 'hit'] += values['']
+    for view, (misses, hits) in sorted(ratios.items()):
+        lines.append(
+            f'yatube_cache_hit_ratio{_format_labels("{}", view=view)} '
+            f'{_number(round(hits / (hits + misses), 4))}'
+        )
+    return '\n'.join(lines) + '\n'
+
+
+def view_label(request, status):
+    """Имя маршрута; без него — обработчик ошибки из core.views."""
+    match = request.resolver_match
+    if match is not None:
+        return match.view_name
+    if status in (400, 403, 404, 500):
+        handler, _ = get_resolver().resolve_error_handler(status)
+        return f'{handler.__module__}.{handler.__name__}'
+    return 'unresolved'
+
+
+class MetricsMiddleware:
+    """Считает каждый запрос в общем хранилище метрик.
+
+    Включается настройкой METRICS_DATABASE; время, запросы к БД
+    и чтения кэша берутся из замеров core.timing.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_DATABASE:
+            raise MiddlewareNotUsed
+        timing.install()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with timing.record() as timings:
+            response = self.get_response(request)
+        store = get_store()
+        if store is None:
+            return response
+        view = view_label(request, response.status_code)
+        store.observe(
+            'yatube_request_duration_seconds',
+            {'view': view, 'status': response.status_code},
+            timings.total_ms / 1000,
+        )
+        store.observe(
+            'yatube_db_queries', {'view': view}, timings.db_queries
+        )
+        for result, count in (('hit', timings.cache_hits),
+                              ('miss', timings.cache_misses)):
+            if count:
+                store.inc(
+                    'yatube_cache_requests_total',
+                    {'view': view, 'result': result}, count
+                )
+        return response
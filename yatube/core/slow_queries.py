@@ -0,0 +1,192 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import ExitStack
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+
+from core.sqlite import LocalConnection
+
+
+logger = logging.getLogger(__name__)
+
+_log = None
+_log_lock = threading.Lock()
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\(\?(?:\s*,\s*\?)+\)')
+_SPACES = re.compile(r'\s+')
+
+# Сортировки отчёта: имя опции — выражение SQL.
+ORDERINGS = {
+    'total': 'total_ms',
+    'count': 'count',
+    'max': 'max_ms',
+    'avg': 'total_ms / count',
+}
+
+
+def shape(sql):
+    """Запрос без значений: литералы и списки IN сводятся к «?».
+
+    Запросы, различающиеся только значениями и длиной списков,
+    получают одну форму и один отпечаток.
+    """
+    sql = _LITERALS.sub('?', sql).replace('%s', '?')
+    return _SPACES.sub(' ', _LISTS.sub('(?)', sql)).strip()
+
+
+def fingerprint(query_shape):
+    return hashlib.md5(query_shape.encode()).hexdigest()[:16]
+
+
+def explain(connection, sql, params):
+    """Вывод EXPLAIN QUERY PLAN для SQLite, для других СУБД None.
+
+    Курсор берётся в обход execute_wrapper, чтобы EXPLAIN сам
+    не попал в замеры.
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    cursor = connection.create_cursor()
+    try:
+        rows = cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    except Exception:
+        return None
+    finally:
+        cursor.close()
+    return '\n'.join(row[-1] for row in rows)
+
+
+class SlowQueryLog:
+    """Медленные запросы по отпечаткам в файле SQLite.
+
+    Повтор запроса той же формы увеличивает счётчик и суммарное
+    время; образец хранится от самого долгого выполнения.
+    """
+
+    def __init__(self, location):
+        self._db = LocalConnection(
+            location,
+            'CREATE TABLE IF NOT EXISTS slow_queries ('
+            'fingerprint TEXT PRIMARY KEY, shape TEXT NOT NULL, '
+            'sample TEXT NOT NULL, plan TEXT, view TEXT, '
+            'count INTEGER NOT NULL, total_ms REAL NOT NULL, '
+            'max_ms REAL NOT NULL, last_seen REAL NOT NULL)',
+        )
+        # Отпечатки, для которых этот процесс уже снял план.
+        self.explained = set()
+
+    def record(self, query_shape, sample, plan, view, elapsed_ms):
+        with self._db.transaction() as connection:
+            connection.execute(
+                'INSERT INTO slow_queries (fingerprint, shape, sample, '
+                'plan, view, count, total_ms, max_ms, last_seen) '
+                'VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?) '
+                'ON CONFLICT (fingerprint) DO UPDATE SET '
+                'count = count + 1, '
+                'total_ms = total_ms + excluded.total_ms, '
+                'sample = CASE WHEN excluded.max_ms > max_ms '
+                'THEN excluded.sample ELSE sample END, '
+                'max_ms = max(max_ms, excluded.max_ms), '
+                'plan = coalesce(excluded.plan, plan), '
+                'view = excluded.view, last_seen = excluded.last_seen',
+                (fingerprint(query_shape), query_shape, sample, plan, view,
+                 elapsed_ms, elapsed_ms, time.time())
+            )
+
+    def top(self, limit, order='total'):
+        """Самые тяжёлые формы запросов по ORDERINGS[order]."""
+        rows = self._db.get().execute(
+            'SELECT fingerprint, shape, sample, plan, view, count, '
+            'total_ms, max_ms FROM slow_queries '
+            f'ORDER BY {ORDERINGS[order]} DESC LIMIT ?', (limit,)
+        )
+        columns = [column[0] for column in rows.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def reset(self):
+        with self._db.transaction() as connection:
+            connection.execute('DELETE FROM slow_queries')
+        self.explained.clear()
+
+
+def get_log():
+    """Журнал из settings.SLOW_QUERY_LOG или None, если выключен."""
+    global _log
+    with _log_lock:
+        if _log is None and settings.SLOW_QUERY_LOG:
+            _log = SlowQueryLog(settings.SLOW_QUERY_LOG)
+        return _log
+
+
+@receiver(setting_changed)
+def _slow_query_log_changed(setting, **kwargs):
+    global _log
+    if setting == 'SLOW_QUERY_LOG':
+        with _log_lock:
+            _log = None
+
+
+class SlowQueryMiddleware:
+    """Пишет в журнал запросы дольше SLOW_QUERY_THRESHOLD_MS.
+
+    Включается настройкой SLOW_QUERY_LOG. Каждая запись — строка
+    JSON в лог core.slow_queries с маршрутом, временем и планом;
+    сводку по отпечаткам печатает manage.py slow_queries.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_LOG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        wrapper = partial(self.measure, request)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper))
+            return self.get_response(request)
+
+    def measure(self, request, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms >= settings.SLOW_QUERY_THRESHOLD_MS:
+                self.report(request, sql, params, many, context, elapsed_ms)
+
+    def report(self, request, sql, params, many, context, elapsed_ms):
+        log = get_log()
+        if log is None:
+            return
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        query_shape = shape(sql)
+        key = fingerprint(query_shape)
+        plan = None
+        if not many and key not in log.explained:
+            plan = explain(context['connection'], sql, params)
+            log.explained.add(key)
+        # Параметры — это ключи сессий, хэши паролей, почта и тексты
+        # постов: в файл и в лог они попадают только по явной настройке.
+        sample = sql
+        if settings.SLOW_QUERY_LOG_PARAMS and not many:
+            sample = f'{sql} -- {list(params or ())!r}'
+        log.record(query_shape, sample, plan, view, elapsed_ms)
+        logger.warning(json.dumps({
+            'view': view,
+            'ms': round(elapsed_ms, 2),
+            'fingerprint': key,
+            'sql': sample,
+            'plan': plan,
+        }, ensure_ascii=False))
@@ -0,0 +1,45 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class LocalConnection:
+    """Соединение с файлом SQLite в режиме WAL, своё у потока и процесса.
+
+    После fork унаследованное соединение SQLite использовать нельзя,
+    поэтому процесс-потомок открывает своё. schema — запросы, которые
+    выполняются на каждом новом соединении (CREATE ... IF NOT EXISTS).
+    """
+
+    def __init__(self, location, *schema):
+        self.location = location
+        self.schema = schema
+        self._local = threading.local()
+
+    def get(self):
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            connection = sqlite3.connect(
+                self.location, timeout=30, isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.schema:
+                connection.execute(statement)
+            self._local.pid, self._local.connection = pid, connection
+        return self._local.connection
+
+    @contextmanager
+    def transaction(self):
+        # IMMEDIATE сразу берёт блокировку записи: чтение и запись внутри
+        # транзакции атомарны относительно других процессов.
+        connection = self.get()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
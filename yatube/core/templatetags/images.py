@@ -0,0 +1,68 @@
+from django import template
+from django.conf import settings
+from sorl.thumbnail import default
+
+from core import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def cached_thumbnail(image, geometry, **options):
+    """Готовая миниатюра картинки или None.
+
+    В отличие от {% thumbnail %} не генерирует миниатюру в запросе:
+    промах лишь ставит её подготовку в фоновый пул.
+    """
+    if not image:
+        return None
+    thumbnail = default.backend.get_cached(image, geometry, **options)
+    if thumbnail is None:
+        thumbnails.queue(image)
+        if not settings.THUMBNAIL_WORKERS:
+            thumbnail = default.backend.get_cached(image, geometry, **options)
+    return thumbnail
+
+
+@register.simple_tag
+def prefetch_thumbnails(page):
+    """Находит миниатюры всех постов страницы одним обращением к KV.
+
+    Ставится внутри {% cache %}: при попадании в кэш фрагмента
+    страница не вычисляется вовсе.
+    """
+    thumbnails.prefetch(post.image for post in page)
+    return ''
+
+
+@register.inclusion_tag('includes/responsive_image.html')
+def responsive_image(image, geometry, sizes=None, css_class='card-img my-2',
+                     **options):
+    """<img> с srcset из заранее готовых ширин THUMBNAIL_SRCSET_WIDTHS.
+
+    В srcset попадают только уже готовые варианты; если какого-то
+    нет, его подготовка ставится в очередь.
+    """
+    src = cached_thumbnail(image, geometry, **options)
+    srcset = []
+    missing = False
+    if src:
+        for width, variant, variant_options in thumbnails.srcset_variants(
+            geometry, options
+        ):
+            thumbnail = default.backend.get_cached(
+                image, variant, **variant_options
+            )
+            if thumbnail is None:
+                missing = True
+            else:
+                srcset.append(f'{thumbnail.url} {width}w')
+    if missing:
+        thumbnails.queue(image)
+    return {
+        'image': image,
+        'src': src,
+        'srcset': ', '.join(srcset),
+        'sizes': sizes or settings.THUMBNAIL_SRCSET_SIZES,
+        'css_class': css_class,
+    }
@@ -1,7 +1,457 @@
-from django.test import TestCase
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default
+
+from core import metrics, slow_queries, thumbnails
+from core.cache import SQLiteCache, TieredSQLiteCache
+from posts.models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 class ViewTestClass (TestCase):
     def test_error_page(self):
         response = self.client.get('/nonexist-page/')
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth_user')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, name):
+        return Post.objects.create(
+            text='test text',
+            author=self.user,
+            image=SimpleUploadedFile(
+                name=name, content=SMALL_GIF, content_type='image/gif'
+            ),
+        )
+
+    def cached(self, post):
+        geometry, options = settings.THUMBNAIL_PRESETS[0]
+        return default.backend.get_cached(post.image, geometry, **options)
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_thumbnails_generated_on_save(self):
+        """Миниатюры готовятся при сохранении поста."""
+        post = self.create_post('sync.gif')
+        self.assertIsNotNone(self.cached(post))
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_template_falls_back_to_original(self):
+        """Пока миниатюры нет, шаблон показывает оригинал."""
+        post = self.create_post('async.gif')
+        self.assertIsNone(self.cached(post))
+        html = render_to_string(
+            'posts/includes/post_image.html', {'post': post}
+        )
+        self.assertIn(post.image.url, html)
+
+        thumbnails.generate(post.image.name)
+        thumbnail = self.cached(post)
+        html = render_to_string(
+            'posts/includes/post_image.html', {'post': post}
+        )
+        self.assertIn(thumbnail.url, html)
+        self.assertNotIn(post.image.url, html)
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_prefetch_resolves_page_in_one_lookup(self):
+        """prefetch находит миниатюры страницы одним запросом к KV."""
+        posts = [self.create_post(f'page_{i}.gif') for i in range(3)]
+        thumbnails.resolved.clear()
+        cache.clear()
+        with self.assertNumQueries(1):
+            thumbnails.prefetch(post.image for post in posts)
+        with self.assertNumQueries(0):
+            for post in posts:
+                html = render_to_string(
+                    'posts/includes/post_image.html', {'post': post}
+                )
+                self.assertIn(self.cached(post).url, html)
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_responsive_image_srcset(self):
+        """srcset перечисляет все ширины THUMBNAIL_SRCSET_WIDTHS."""
+        post = self.create_post('srcset.gif')
+        html = render_to_string(
+            'posts/includes/post_image.html', {'post': post}
+        )
+        self.assertIn('srcset="', html)
+        for width in settings.THUMBNAIL_SRCSET_WIDTHS:
+            self.assertIn(f' {width}w', html)
+
+    @override_settings(THUMBNAIL_WORKERS=0, SERVER_TIMING_SAMPLE_RATE=1)
+    def test_server_timing_counts_generation(self):
+        """Время синхронной подготовки миниатюр попадает в замеры."""
+        with override_settings(THUMBNAIL_WORKERS=2):
+            post = self.create_post('timing.gif')
+        cache.clear()
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            response = self.client.get(
+                reverse('posts:post_detail', args=[post.pk])
+            )
+        self.assertIsNotNone(self.cached(post))
+        self.assertGreater(
+            json.loads(logs.records[0].getMessage())['thumbnail_ms'], 0
+        )
+        self.assertNotIn('thumb;dur=0.0', response['Server-Timing'])
+
+
+def _incr_many(location, times):
+    shared = SQLiteCache(location, {})
+    for _ in range(times):
+        shared.incr('counter')
+
+
+def _observe_many(location, times):
+    store = metrics.MetricsStore(location)
+    for _ in range(times):
+        store.observe('yatube_db_queries', {'view': 'worker'}, 3)
+    store.flush()
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_basic_operations(self):
+        self.cache.set('key', {'value': 1})
+        self.cache.set_many({'a': 1, 'b': [2]})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'missing']), {'a': 1, 'b': [2]}
+        )
+        self.assertFalse(self.cache.add('a', 10))
+        self.assertTrue(self.cache.add('c', 3))
+        self.assertEqual(self.cache.incr('a', 5), 6)
+        self.assertEqual(self.cache.decr('a'), 5)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.delete_many(['a', 'key'])
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('expired', 1, timeout=0)
+        self.assertFalse(self.cache.has_key('expired'))
+        self.assertTrue(self.cache.add('expired', 2))
+
+    def test_shared_between_instances(self):
+        self.cache.set('key', 'value')
+        self.assertEqual(SQLiteCache(self.location, {}).get('key'), 'value')
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=_incr_many, args=(self.location, 50))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+
+    def test_size_cap_evicts_least_recently_read(self):
+        capped = SQLiteCache(self.location, {
+            'OPTIONS': {'MAX_ENTRIES': 50, 'CULL_FREQUENCY': 2},
+        })
+        capped.set('hot', 1)
+        capped.ACCESS_RESOLUTION = 0
+        for i in range(SQLiteCache.CULL_EVERY):
+            capped.set(f'cold-{i}', i)
+            capped.get('hot')
+        self.assertEqual(capped.get('hot'), 1)
+        self.assertLessEqual(
+            len(capped.get_many(f'cold-{i}' for i in range(100))), 50
+        )
+
+    def test_tiered_cache_reads_through_l1(self):
+        first = TieredSQLiteCache(self.location, {
+            'OPTIONS': {'L1_TIMEOUT': 1},
+        })
+        second = SQLiteCache(self.location, {})
+        first.set('key', 'old')
+        second.set('key', 'new')
+        # Запись другого процесса видна после L1_TIMEOUT.
+        self.assertEqual(first.get('key'), 'old')
+        first.l1.clear()
+        self.assertEqual(first.get('key'), 'new')
+        first.set('counter', 1)
+        self.assertEqual(first.incr('counter'), 2)
+        self.assertEqual(second.get('counter'), 2)
+
+
+class ServerTimingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth_user')
+        Post.objects.create(text='test text', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_index(self):
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            response = self.client.get(reverse('posts:index'))
+        return response, json.loads(logs.records[0].getMessage())
+
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_header_and_log(self):
+        response, record = self.get_index()
+        self.assertEqual(record['view'], 'posts:index')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['db_queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertGreater(record['cache_misses'], 0)
+        header = response['Server-Timing']
+        self.assertIn(f'desc="{record["db_queries"]} queries"', header)
+        for metric in ('db;', 'tpl;', 'cache;', 'thumb;', 'total;'):
+            self.assertIn(metric, header)
+
+        _, record = self.get_index()
+        self.assertGreater(record['cache_hits'], 0)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0.5)
+    def test_sampling(self):
+        with mock.patch('core.timing.random.random', return_value=0.7):
+            response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+        with mock.patch('core.timing.random.random', return_value=0.2):
+            response, _ = self.get_index()
+        self.assertIn('Server-Timing', response)
+
+
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth_user')
+        Post.objects.create(text='test text', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'metrics.sqlite3')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        # Сброс хранилища при смене настройки пишет ещё в каталог теста
+        override = self.settings(
+            METRICS_DATABASE=self.location, METRICS_TOKEN='test-token'
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def scrape(self, token='test-token', **extra):
+        if token:
+            extra['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+        return self.client.get(reverse('metrics'), **extra)
+
+    def test_requests_are_counted(self):
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        self.client.get('/nonexist-page/')
+        response = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertIn(
+            'yatube_requests_total{status="200",view="posts:index"} 2', text
+        )
+        self.assertIn(
+            'yatube_requests_total{status="404",'
+            'view="core.views.page_not_found"} 1', text
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{status="200",'
+            'view="posts:index",le="+Inf"} 2', text
+        )
+        self.assertIn(
+            'yatube_db_queries_count{view="posts:index"} 2', text
+        )
+        self.assertIn('yatube_cache_hit_ratio{view="posts:index"}', text)
+
+    def test_aggregated_across_processes(self):
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(
+                target=_observe_many, args=(self.location, 10)
+            )
+            for _ in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        text = self.scrape().content.decode()
+        self.assertIn('yatube_db_queries_count{view="worker"} 30', text)
+        self.assertIn('yatube_db_queries_sum{view="worker"} 90', text)
+        self.assertIn(
+            'yatube_db_queries_bucket{view="worker",le="2"} 0', text
+        )
+        self.assertIn(
+            'yatube_db_queries_bucket{view="worker",le="3"} 30', text
+        )
+
+    def test_idle_process_flushes(self):
+        """Приращения без следующего inc сбрасываются по таймеру."""
+        idle = metrics.MetricsStore(self.location)
+        self.addCleanup(idle.close)
+        with mock.patch.object(metrics.MetricsStore, 'FLUSH_INTERVAL', 0.05):
+            idle.inc('yatube_cache_requests_total',
+                     {'view': 'idle', 'result': 'hit'})
+            timer = idle._timer
+        self.assertNotIn('view="idle"', self.scrape().content.decode())
+        timer.join()
+        self.assertIn(
+            'yatube_cache_requests_total{result="hit",view="idle"} 1',
+            self.scrape().content.decode()
+        )
+
+    def test_flushed_at_exit(self):
+        """Процесс, завершившийся до сброса, не теряет приращения."""
+        subprocess.run(
+            [sys.executable, '-c', (
+                'import django; django.setup(); '
+                'from core.metrics import MetricsStore; '
+                f'MetricsStore({self.location!r}).inc('
+                "'yatube_cache_requests_total', "
+                "{'view': 'exit', 'result': 'miss'})"
+            )],
+            cwd=settings.BASE_DIR, check=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'yatube.settings'},
+        )
+        self.assertIn(
+            'yatube_cache_requests_total{result="miss",view="exit"} 1',
+            self.scrape().content.decode()
+        )
+
+    def test_token_or_staff_only(self):
+        """Адрес 127.0.0.1 (обратный прокси) сам по себе доступа не даёт."""
+        self.assertEqual(
+            self.scrape(token=None, REMOTE_ADDR='127.0.0.1').status_code, 404
+        )
+        self.assertEqual(self.scrape(token='wrong').status_code, 404)
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(self.scrape(token='None').status_code, 404)
+            staff = User.objects.create_user(
+                username='staff', is_staff=True
+            )
+            self.client.force_login(staff)
+            self.assertEqual(self.scrape(token=None).status_code, 200)
+        with self.settings(METRICS_DATABASE=None):
+            self.assertEqual(self.scrape().status_code, 404)
+
+
+class SlowQueryLogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth_user')
+        Post.objects.create(text='test text', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        override = self.settings(
+            SLOW_QUERY_LOG=os.path.join(self.directory, 'slow.sqlite3'),
+            SLOW_QUERY_THRESHOLD_MS=0,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def report(self, *args):
+        out = StringIO()
+        call_command('slow_queries', *args, stdout=out)
+        return out.getvalue()
+
+    def test_shape_ignores_values(self):
+        self.assertEqual(
+            slow_queries.shape('SELECT * FROM t WHERE id IN (%s, %s) '
+                               "AND name = 'x' LIMIT 21"),
+            slow_queries.shape('SELECT  *  FROM t WHERE id IN (%s) '
+                               "AND name = 'it''s' LIMIT 10"),
+        )
+
+    def test_queries_logged_with_plan_and_counts(self):
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'))
+            cache.clear()
+            self.client.get(reverse('posts:index'))
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['view'], 'posts:index')
+        self.assertIsNotNone(entry['plan'])
+
+        top = slow_queries.get_log().top(10, 'count')
+        self.assertEqual(top[0]['count'], 2)
+        self.assertEqual(top[0]['view'], 'posts:index')
+        self.assertTrue(all(row['plan'] for row in top))
+
+        output = self.report('--plans', '--reset')
+        self.assertIn('posts:index', output)
+        self.assertIn('SCAN', output)
+        self.assertEqual(slow_queries.get_log().top(10), [])
+
+    def test_params_not_logged(self):
+        """Значения параметров не попадают ни в журнал, ни в лог."""
+        User.objects.create_user(username='private_name')
+        url = reverse('posts:profile', kwargs={'username': 'private_name'})
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.client.get(url)
+        self.assertNotIn('private_name', '\n'.join(logs.output))
+        samples = [row['sample'] for row in slow_queries.get_log().top(50)]
+        self.assertNotIn('private_name', '\n'.join(samples))
+        slow_queries.get_log().reset()
+        cache.clear()
+        with self.settings(SLOW_QUERY_LOG_PARAMS=True), \
+                self.assertLogs('core.slow_queries', 'WARNING'):
+            self.client.get(url)
+        samples = [row['sample'] for row in slow_queries.get_log().top(50)]
+        self.assertIn('private_name', '\n'.join(samples))
+
+    def test_threshold(self):
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=60_000):
+            self.client.get(reverse('posts:index'))
+        self.assertEqual(slow_queries.get_log().top(10), [])
@@ -0,0 +1,262 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.dispatch import Signal
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend as BaseThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as BaseKVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import timing
+
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pending = set()
+_lock = threading.Lock()
+
+# Все миниатюры картинки готовы. Страницы, отрисованные до этого,
+# показывают оригинал: получатели сбрасывают их кэши.
+thumbnails_ready = Signal(providing_args=['name'])
+
+
+class LRUCache:
+    """Потокобезопасный LRU недавно найденных миниатюр процесса.
+
+    Готовая миниатюра неизменна для своего ключа, поэтому хранится
+    без срока; промах помнится MISS_TTL секунд, чтобы страница,
+    только что прошедшая prefetch, не ходила в KV за каждой картинкой.
+    """
+
+    MISS_TTL = 2
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(найдено, миниатюра или None)."""
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return False, None
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        expires = None if value else time.monotonic() + self.MISS_TTL
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+resolved = LRUCache(settings.THUMBNAIL_LRU_SIZE)
+
+
+class KVStore(BaseKVStore):
+    """KV-хранилище sorl с пакетным чтением."""
+
+    def get_many(self, image_files):
+        """{ключ: ImageFile или None} за один get_many кэша.
+
+        Промахи кэша добираются одним запросом к БД и кладутся
+        обратно в кэш, как это делает _get_raw для одиночных ключей.
+        """
+        raw_keys = {add_prefix(image.key): image.key for image in image_files}
+        values = self.cache.get_many(list(raw_keys))
+        missing = [key for key in raw_keys if key not in values]
+        if missing:
+            found = dict(KVStoreModel.objects.filter(
+                key__in=missing
+            ).values_list('key', 'value'))
+            for key in missing:
+                values[key] = found.get(key, EMPTY_VALUE)
+            self.cache.set_many(
+                {key: values[key] for key in missing},
+                sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+            )
+        return {
+            raw_keys[key]: (
+                None if value == EMPTY_VALUE
+                else deserialize_image_file(value)
+            )
+            for key, value in values.items()
+        }
+
+
+class ThumbnailBackend(BaseThumbnailBackend):
+    """Бэкенд sorl, умеющий искать миниатюру без её генерации."""
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """ImageFile будущей миниатюры: то же имя, что у get_thumbnail."""
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_cached(self, file_, geometry_string, **options):
+        """Готовая миниатюра из LRU или KV-хранилища, иначе None."""
+        if not file_:
+            return None
+        thumbnail = self.thumbnail_file(file_, geometry_string, **options)
+        found, cached = resolved.get(thumbnail.key)
+        if not found:
+            cached = default.kvstore.get(thumbnail)
+            resolved.set(thumbnail.key, cached)
+        return cached
+
+
+def srcset_variants(geometry, options):
+    """Лестница (ширина, геометрия, опции) для srcset.
+
+    Ширины берутся из THUMBNAIL_SRCSET_WIDTHS, высота — по пропорции
+    исходной геометрии, так что кадрирование у всех вариантов общее.
+    """
+    width, height = (int(side) for side in geometry.split('x'))
+    return [
+        (step, f'{step}x{round(step * height / width)}', options)
+        for step in settings.THUMBNAIL_SRCSET_WIDTHS
+    ]
+
+
+def presets():
+    """Все геометрии, которые готовятся заранее: пресеты и их srcset."""
+    result = {}
+    for geometry, options in settings.THUMBNAIL_PRESETS:
+        result[geometry] = options
+        for _, variant, variant_options in srcset_variants(
+            geometry, options
+        ):
+            result.setdefault(variant, variant_options)
+    return list(result.items())
+
+
+def prefetch(images):
+    """Разом находит заранее готовящиеся миниатюры картинок страницы.
+
+    Всё, чего нет в LRU, читается одним get_many KV-хранилища, после
+    чего {% cached_thumbnail %} на странице обходится без обращений
+    к кэшу и БД.
+    """
+    wanted = {}
+    for image in images:
+        if not image:
+            continue
+        for geometry, options in presets():
+            thumbnail = default.backend.thumbnail_file(
+                image, geometry, **options
+            )
+            if not resolved.get(thumbnail.key)[0]:
+                wanted[thumbnail.key] = thumbnail
+    if not wanted:
+        return
+    get_many = getattr(default.kvstore, 'get_many', None)
+    if get_many is None:
+        found = {key: default.kvstore.get(image)
+                 for key, image in wanted.items()}
+    else:
+        found = get_many(wanted.values())
+    for key, thumbnail in found.items():
+        resolved.set(key, thumbnail)
+
+
+def ready(image):
+    """True, если все миниатюры из presets() для картинки готовы."""
+    return all(
+        default.backend.get_cached(image, geometry, **options)
+        for geometry, options in presets()
+    )
+
+
+def generate(name):
+    """Готовит все миниатюры из presets() для файла.
+
+    Возвращает True, если все миниатюры готовы; тогда же рассылает
+    thumbnails_ready.
+    """
+    try:
+        with timing.measure('thumbnail_ms'):
+            for geometry, options in presets():
+                thumbnail = default.backend.get_thumbnail(
+                    name, geometry, **options
+                )
+                # Сбрасываем запомненный промах; при ошибке генерации
+                # в KV ничего не попадёт, и в LRU останется None.
+                resolved.set(
+                    thumbnail.key, default.kvstore.get(thumbnail)
+                )
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры для %s', name)
+        return False
+    thumbnails_ready.send(sender=ThumbnailBackend, name=name)
+    return True
+
+
+def _run(name):
+    # Воркер пула живёт дольше запроса: соединения с БД, открытые
+    # KV-хранилищем sorl, закрываем сами.
+    try:
+        generate(name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+        connections.close_all()
+
+
+def _submit(name):
+    global _pool
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    _pool.submit(_run, name)
+
+
+def queue(image):
+    """Ставит подготовку миниатюр картинки в фоновый пул.
+
+    Задача уходит в пул только после коммита транзакции, чтобы воркер
+    видел сохранённый пост. При THUMBNAIL_WORKERS = 0 миниатюры
+    готовятся сразу, в текущем потоке.
+    """
+    if not image:
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        generate(image.name)
+        return
+    name = image.name
+    transaction.on_commit(lambda: _submit(name))
@@ -0,0 +1,205 @@
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_install_lock = threading.Lock()
+_MISSING = object()
+
+
+class Timings:
+    """Замеры одного запроса; время — в миллисекундах.
+
+    Время шаблонов включает запросы к БД и кэшу из самих шаблонов.
+    """
+
+    def __init__(self):
+        self.db_ms = 0.0
+        self.db_queries = 0
+        self.template_ms = 0.0
+        self.cache_ms = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.thumbnail_ms = 0.0
+        self.total_ms = 0.0
+        self.started = time.perf_counter()
+        # Вложенные вызовы (include через render_to_string, get_many
+        # поверх get) учитываются только снаружи.
+        self.depth = {}
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - started) * 1000
+            self.db_queries += 1
+
+    def finish(self):
+        """Фиксирует полное время с начала замеров."""
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+
+    def header(self):
+        """Значение заголовка Server-Timing."""
+        return ', '.join((
+            f'db;dur={self.db_ms:.1f};desc="{self.db_queries} queries"',
+            f'tpl;dur={self.template_ms:.1f}',
+            f'cache;dur={self.cache_ms:.1f};'
+            f'desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'thumb;dur={self.thumbnail_ms:.1f}',
+            f'total;dur={self.total_ms:.1f}',
+        ))
+
+    def as_dict(self):
+        return {
+            name: round(value, 2) if isinstance(value, float) else value
+            for name, value in vars(self).items()
+            if name not in ('depth', 'started')
+        }
+
+
+def current():
+    """Замеры текущего запроса или None, если он не замеряется."""
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def record():
+    """Замеры на время блока; вложенный вызов продолжает внешние."""
+    timings = current()
+    if timings is not None:
+        yield timings
+        return
+    timings = _local.timings = Timings()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(timings.db_wrapper)
+                )
+            yield timings
+    finally:
+        _local.timings = None
+        timings.finish()
+
+
+@contextmanager
+def measure(field):
+    """Прибавляет время блока к полю field замеров текущего запроса."""
+    timings = current()
+    if timings is None or timings.depth.get(field):
+        yield
+        return
+    timings.depth[field] = 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.depth[field] = 0
+        elapsed = (time.perf_counter() - started) * 1000
+        setattr(timings, field, getattr(timings, field) + elapsed)
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapper(self, *args, **kwargs):
+        with measure('template_ms'):
+            return render(self, *args, **kwargs)
+    wrapper.timed = True
+    return wrapper
+
+
+def _timed_get(get):
+    @wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        timings = current()
+        if timings is None or timings.depth.get('cache_ms'):
+            return get(self, key, default, version=version)
+        with measure('cache_ms'):
+            value = get(self, key, _MISSING, version=version)
+        if value is _MISSING:
+            timings.cache_misses += 1
+            return default
+        timings.cache_hits += 1
+        return value
+    wrapper.timed = True
+    return wrapper
+
+
+def _timed_get_many(get_many):
+    @wraps(get_many)
+    def wrapper(self, keys, version=None):
+        timings = current()
+        if timings is None or timings.depth.get('cache_ms'):
+            return get_many(self, keys, version=version)
+        keys = list(keys)
+        with measure('cache_ms'):
+            found = get_many(self, keys, version=version)
+        timings.cache_hits += len(found)
+        timings.cache_misses += len(keys) - len(found)
+        return found
+    wrapper.timed = True
+    return wrapper
+
+
+def install():
+    """Оборачивает отрисовку шаблонов и чтения из всех кэшей.
+
+    Вызывается только при включённых замерах, так что с выключенными
+    код Django и бэкендов кэша не меняется.
+    """
+    with _install_lock:
+        if not getattr(Template.render, 'timed', False):
+            Template.render = _timed_render(Template.render)
+        for options in settings.CACHES.values():
+            backend = import_string(options['BACKEND'])
+            if not getattr(backend.get, 'timed', False):
+                backend.get = _timed_get(backend.get)
+            if not getattr(backend.get_many, 'timed', False):
+                backend.get_many = _timed_get_many(backend.get_many)
+
+
+class ServerTimingMiddleware:
+    """Замеряет БД, шаблоны, кэш и миниатюры в доле запросов.
+
+    Доля задаётся SERVER_TIMING_SAMPLE_RATE; при 0 middleware
+    исключается из цепочки целиком. Итог уходит в заголовок
+    Server-Timing и строкой JSON в лог core.timing с именем маршрута.
+    """
+
+    def __init__(self, get_response):
+        self.rate = settings.SERVER_TIMING_SAMPLE_RATE
+        if self.rate <= 0:
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if self.rate < 1 and random.random() >= self.rate:
+            return self.get_response(request)
+        with record() as timings:
+            response = self.get_response(request)
+            # Замеры могли начаться раньше, в core.metrics, и ещё идут.
+            timings.finish()
+        response['Server-Timing'] = timings.header()
+        match = request.resolver_match
+        logger.info(json.dumps({
+            'view': match.view_name if match else None,
+            'method': request.method,
+            'status': response.status_code,
+            **timings.as_dict(),
+        }, sort_keys=True))
+        return response
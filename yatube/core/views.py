@@ -1,6 +1,11 @@
 from http import HTTPStatus
 
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from core import metrics as metrics_store
 
 
 def page_not_found(request, exception):
@@ -14,8 +19,36 @@ def csrf_failure(request, reason=''):
 
 
 def server_error(request):
-    return render(request, 'core/500.html', HTTPStatus.INTERNAL_SERVER_ERROR)
+    return render(
+        request, 'core/500.html',
+        status=HTTPStatus.INTERNAL_SERVER_ERROR
+    )
 
 
 def permission_denied(request, exception):
-    return render(request, 'core/403.html', HTTPStatus.FORBIDDEN)
+    return render(request, 'core/403.html', status=HTTPStatus.FORBIDDEN)
+
+
+def _has_metrics_token(request):
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and constant_time_compare(header, f'Bearer {token}')
+
+
+def metrics(request):
+    """Метрики всех процессов в формате Prometheus.
+
+    Доступны сотрудникам и по токену METRICS_TOKEN. Адресу клиента
+    не доверяем: за обратным прокси на той же машине все запросы
+    приходят с 127.0.0.1. Для остальных, как и при выключенных
+    метриках, страницы нет.
+    """
+    store = metrics_store.get_store()
+    if store is None or not (
+        request.user.is_staff or _has_metrics_token(request)
+    ):
+        raise Http404
+    return HttpResponse(
+        metrics_store.render(store.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core import thumbnails
+
+from . import feed_cache
+
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+def card_key(post, generation):
+    """Ключ карточки: пост, его updated_at и поколение авторов и групп.
+
+    Имя автора и slug группы меняются без сохранения поста, их
+    изменения сдвигают общее поколение feed_cache.ALL.
+    """
+    return (f'post-card:{post.pk}:'
+            f'{post.updated_at.timestamp()}:{generation}')
+
+
+def render_cards(posts):
+    """Список (пост, HTML карточки) для страницы ленты.
+
+    Готовые карточки читаются одним get_many, отрисовываются только
+    промахи. Карточка, у которой ещё нет миниатюр, в кэш не кладётся:
+    иначе вместо миниатюры в ней надолго застрянет оригинал.
+    """
+    posts = list(posts)
+    generation = feed_cache.generation(feed_cache.ALL)
+    keys = {post.pk: card_key(post, generation) for post in posts}
+    cards = cache.get_many(list(keys.values()))
+    missing = [post for post in posts if keys[post.pk] not in cards]
+    thumbnails.prefetch(post.image for post in missing)
+    fresh = {}
+    for post in missing:
+        html = render_to_string(CARD_TEMPLATE, {'post': post})
+        cards[keys[post.pk]] = html
+        if not post.image or thumbnails.ready(post.image):
+            fresh[keys[post.pk]] = html
+    if fresh:
+        cache.set_many(fresh, settings.POSTS_CARD_CACHE_TTL)
+    return [(post, mark_safe(cards[keys[post.pk]])) for post in posts]
@@ -0,0 +1,111 @@
+from itertools import islice
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, PostStats, User, UserStats
+
+
+BATCH_SIZE: int = 500
+
+
+def _count(queryset, field):
+    """Коррелированный подзапрос COUNT(*) по полю field."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def _bump(model, lookup, **deltas):
+    # Уменьшаем только неотрицательно: дрейф после bulk-операций
+    # не должен упираться в CHECK (count >= 0).
+    for field, delta in deltas.items():
+        if delta < 0:
+            lookup[f'{field}__gte'] = -delta
+    return model.objects.filter(**lookup).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def bump_user(user_id, **deltas):
+    """Сдвигает счётчики пользователя на deltas.
+
+    Если строки счётчиков нет, при увеличении она пересчитывается
+    целиком; при уменьшении отсутствие строки значит, что пользователь
+    удаляется каскадом, и трогать её нельзя.
+    """
+    updated = _bump(UserStats, {'user_id': user_id}, **deltas)
+    if not updated and any(delta > 0 for delta in deltas.values()):
+        recount_users(User.objects.filter(pk=user_id))
+
+
+def bump_post(post_id, delta):
+    """Сдвигает счётчик комментариев поста."""
+    updated = _bump(PostStats, {'post_id': post_id}, comments_count=delta)
+    if not updated and delta > 0:
+        recount_posts(Post.objects.filter(pk=post_id))
+
+
+def user_stats(user):
+    """Счётчики пользователя без агрегатных запросов.
+
+    Для пользователя без строки счётчиков отдаёт несохранённые нули.
+    """
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def post_stats(post):
+    try:
+        return post.stats
+    except PostStats.DoesNotExist:
+        return PostStats(post=post)
+
+
+def _store(model, objects):
+    """Заменяет строки счётчиков пачками по BATCH_SIZE."""
+    total = 0
+    objects = iter(objects)
+    while True:
+        batch = list(islice(objects, BATCH_SIZE))
+        if not batch:
+            return total
+        model.objects.filter(pk__in=[obj.pk for obj in batch]).delete()
+        model.objects.bulk_create(batch)
+        total += len(batch)
+
+
+def recount_users(users=None):
+    """Пересчитывает счётчики пользователей, возвращает их число."""
+    users = (User.objects.all() if users is None else users).annotate(
+        posts_total=_count(Post.objects.all(), 'author'),
+        followers_total=_count(Follow.objects.all(), 'author'),
+        following_total=_count(Follow.objects.all(), 'user'),
+    ).order_by('pk').values_list(
+        'pk', 'posts_total', 'followers_total', 'following_total'
+    )
+    return _store(UserStats, (
+        UserStats(
+            user_id=pk,
+            posts_count=posts,
+            followers_count=followers,
+            following_count=following,
+        )
+        for pk, posts, followers, following in users.iterator()
+    ))
+
+
+def recount_posts(posts=None):
+    """Пересчитывает счётчики комментариев, возвращает число постов."""
+    posts = (Post.objects.all() if posts is None else posts).annotate(
+        comments_total=_count(Comment.objects.all(), 'post'),
+    ).order_by('pk').values_list('pk', 'comments_total')
+    return _store(PostStats, (
+        PostStats(post_id=pk, comments_count=comments)
+        for pk, comments in posts.iterator()
+    ))
@@ -0,0 +1,81 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import feed_cache
+from .models import Group, Post, User
+
+
+def _shared_only(etag_func):
+    # ETag из поколений процесса с LocMemCache не меняется после записи
+    # в другом воркере, и тот отдавал бы 304 с устаревшей страницей:
+    # без общего кэша страницы отдаются без ETag.
+    @wraps(etag_func)
+    def wrapper(request, *args, **kwargs):
+        if feed_cache.is_shared():
+            return etag_func(request, *args, **kwargs)
+    return wrapper
+
+
+def _etag(request, *feeds):
+    # Поколения лент сдвигают и правки моделей, и готовность миниатюр
+    # (core.thumbnails.thumbnails_ready): разметка картинок меняется
+    # без сохранения поста. Страница зависит и от зрителя: шапка,
+    # кнопка подписки, форма комментария с CSRF-токеном.
+    viewer = request.user.pk if request.user.is_authenticated else ''
+    csrf = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    value = f'{feed_cache.version(*feeds)}|{viewer}|{csrf}'
+    return hashlib.md5(value.encode()).hexdigest()
+
+
+def _resolve(queryset, field, **lookup):
+    """Значение field по lookup, запомненное в кэше.
+
+    Ключ включает общее поколение: переименование пользователя или
+    смена slug группы сдвигают его, и старые сопоставления забываются.
+    """
+    key = ':'.join(
+        ['etag-lookup', str(feed_cache.generation(feed_cache.ALL)),
+         queryset.model._meta.label_lower, field,
+         *(f'{name}={value}' for name, value in lookup.items())]
+    )
+    value = cache.get(key)
+    if value is None:
+        value = queryset.filter(**lookup).values_list(
+            field, flat=True
+        ).first()
+        if value is not None:
+            cache.set(key, value, settings.POSTS_PAGE_CACHE_TTL)
+    return value
+
+
+@_shared_only
+def index(request):
+    return _etag(request, feed_cache.INDEX)
+
+
+@_shared_only
+def group_posts(request, slug):
+    pk = _resolve(Group.objects.all(), 'pk', slug=slug)
+    if pk is not None:
+        return _etag(request, feed_cache.group_feed(pk))
+
+
+@_shared_only
+def profile(request, username):
+    pk = _resolve(User.objects.all(), 'pk', username=username)
+    if pk is not None:
+        return _etag(request, feed_cache.author_feed(pk))
+
+
+@_shared_only
+def post_detail(request, post_id):
+    author_id = _resolve(Post.objects.all(), 'author_id', pk=post_id)
+    if author_id is not None:
+        return _etag(
+            request,
+            feed_cache.post_feed(post_id),
+            feed_cache.author_feed(author_id),
+        )
@@ -0,0 +1,82 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+from core.cache import SQLiteCache
+
+
+PREFIX = 'feed-generation'
+
+# Общая лента-поколение: её сдвигают изменения, которые затрагивают
+# карточки во всех лентах сразу (имя автора, slug группы).
+ALL = 'all'
+INDEX = 'index'
+
+
+def group_feed(group_id):
+    return f'group:{group_id}'
+
+
+def author_feed(author_id):
+    return f'author:{author_id}'
+
+
+def _key(feed):
+    return f'{PREFIX}:{feed}'
+
+
+def _start(key):
+    # Поколение начинается с текущего времени в микросекундах: если
+    # счётчик вытеснят из кэша, новое значение не совпадёт со старыми
+    # и не оживит устаревшие фрагменты.
+    cache.add(key, time.time_ns() // 1000, None)
+    return cache.get(key)
+
+
+def generation(feed):
+    """Текущее поколение одной ленты."""
+    key = _key(feed)
+    value = cache.get(key)
+    return _start(key) if value is None else value
+
+
+def is_shared():
+    """Поколения видны всем процессам: 'default' — общий кэш core.cache.
+
+    В LocMemCache у каждого воркера свои счётчики, и запись,
+    обработанная одним воркером, не сдвигает их в остальных.
+    """
+    return isinstance(caches['default'], SQLiteCache)
+
+
+def post_feed(post_id):
+    """Страница поста: сам пост и его комментарии."""
+    return f'post:{post_id}'
+
+
+def version(*feeds):
+    """Строка версии лент для ключа кэша: общее поколение и их."""
+    keys = [_key(ALL), *(_key(feed) for feed in feeds)]
+    found = cache.get_many(keys)
+    return '.'.join(
+        str(found[key] if key in found else _start(key)) for key in keys
+    )
+
+
+def bump(*feeds):
+    """Сдвигает поколения лент: их фрагменты перестают совпадать."""
+    for feed in set(feeds):
+        key = _key(feed)
+        try:
+            cache.incr(key)
+        except ValueError:
+            _start(key)
+
+
+def context(feed):
+    """Переменные шаблона для {% cache %} ленты."""
+    return {
+        'feed_version': version(feed),
+        'feed_cache_ttl': settings.POSTS_FEED_CACHE_TTL,
+    }
@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from . import images
 from .models import Post, Comment
 
 
@@ -21,6 +23,24 @@ class PostForm(forms.ModelForm):
             'image': 'Загрузите картинку',
         }
 
+    def clean_image(self):
+        # Картинка нормализуется один раз, при загрузке: дальше
+        # миниатюры режутся уже из уменьшенного файла без EXIF.
+        image = self.cleaned_data.get('image')
+        self.image_size = (None, None)
+        if isinstance(image, UploadedFile):
+            image, self.image_size = images.normalize(image)
+        return image
+
+    def save(self, commit=True):
+        post = super().save(commit=False)
+        if 'image' in self.changed_data:
+            post.image_width, post.image_height = self.image_size
+        if commit:
+            post.save()
+            self._save_m2m()
+        return post
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,69 @@
+from io import BytesIO
+from pathlib import PurePath
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps, features
+
+
+EXTENSIONS = {
+    'WEBP': 'webp',
+    'JPEG': 'jpg',
+    'PNG': 'png',
+}
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+
+
+def target_format(image):
+    """Формат хранения: POSTS_IMAGE_FORMAT, если Pillow его умеет.
+
+    Без поддержки WebP картинки с прозрачностью сохраняются в PNG,
+    остальные — в JPEG.
+    """
+    preferred = settings.POSTS_IMAGE_FORMAT
+    if preferred == 'WEBP' and features.check('webp'):
+        return 'WEBP'
+    if preferred == 'PNG' or _has_alpha(image):
+        return 'PNG'
+    return 'JPEG'
+
+
+def normalize(upload):
+    """Готовит загруженную картинку к хранению.
+
+    Поворачивает по EXIF, вписывает в POSTS_IMAGE_MAX_SIZE и
+    перекодирует без метаданных. Возвращает (файл, (ширина, высота)).
+    Анимированные картинки сохраняются как есть: перекодирование
+    оставило бы от них один кадр.
+    """
+    image = Image.open(upload)
+    if getattr(image, 'is_animated', False):
+        upload.seek(0)
+        return upload, image.size
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(settings.POSTS_IMAGE_MAX_SIZE, Image.LANCZOS)
+    image_format = target_format(image)
+    if image_format == 'JPEG':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if _has_alpha(image) else 'RGB')
+    # Кодировщик PNG берёт EXIF и ICC-профиль из image.info, если их
+    # не передать явно: сбрасываем всё, что пришло из исходного файла.
+    image.info = {}
+    buffer = BytesIO()
+    image.save(
+        buffer,
+        image_format,
+        quality=settings.POSTS_IMAGE_QUALITY,
+        optimize=True,
+    )
+    name = f'{PurePath(upload.name).stem}.{EXTENSIONS[image_format]}'
+    normalized = SimpleUploadedFile(
+        name, buffer.getvalue(), content_type=Image.MIME[image_format]
+    )
+    return normalized, image.size
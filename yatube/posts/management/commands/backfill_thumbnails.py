@@ -0,0 +1,86 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import thumbnails
+from posts.models import Post
+
+
+BATCH_SIZE = 500
+
+
+def _init_worker():
+    # При запуске через spawn дочерний процесс начинает с чистого листа
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        'Готовит миниатюры и srcset-варианты для уже загруженных '
+        'картинок постов в пуле процессов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help=(
+                'Число процессов (по умолчанию — по числу ядер); '
+                '0 — в текущем процессе.'
+            )
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=20,
+            help='Сколько картинок отдавать процессу за раз.'
+        )
+
+    def missing(self, names):
+        """Картинки, у которых готовы не все миниатюры.
+
+        Готовность проверяется пачками: prefetch читает KV-хранилище
+        одним запросом на BATCH_SIZE картинок.
+        """
+        names = iter(names)
+        while True:
+            batch = list(islice(names, BATCH_SIZE))
+            if not batch:
+                return
+            thumbnails.prefetch(batch)
+            yield from (name for name in batch if not thumbnails.ready(name))
+
+    def generate(self, names, options):
+        if not options['workers']:
+            yield from map(thumbnails.generate, names)
+            return
+        # Соединения с БД не должны переходить в дочерние процессы
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], initializer=_init_worker
+        ) as pool:
+            yield from pool.map(
+                thumbnails.generate, names, chunksize=options['chunk_size']
+            )
+
+    def handle(self, *args, **options):
+        names = list(
+            Post.objects.exclude(image='').order_by().values_list(
+                'image', flat=True
+            ).distinct().iterator()
+        )
+        missing = list(self.missing(names))
+        failed = 0
+        for done, ok in enumerate(self.generate(missing, options), start=1):
+            failed += not ok
+            if done % 100 == 0:
+                self.stdout.write(f'Обработано картинок: {done}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок: {len(missing)}, с ошибками: {failed}, '
+            f'уже готовых: {len(names) - len(missing)}'
+        ))
@@ -0,0 +1,137 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from posts.merge_feed import MergeFeedPaginator
+from posts.models import Follow, Post
+from posts.paginators import CursorPaginator
+from posts.views import COUNT_PUB
+
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает ленту подписок через join и слиянием диапазонов '
+        '(merge) на синтетических данных; данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--follows',
+            type=int,
+            nargs='+',
+            default=[10, 100, 1000],
+            help='Числа подписок читателя (по умолчанию 10 100 1000).'
+        )
+        parser.add_argument(
+            '--posts-per-author',
+            type=int,
+            default=20,
+            help='Постов у каждого автора.'
+        )
+        parser.add_argument(
+            '--pages',
+            type=int,
+            default=3,
+            help='Сколько страниц ленты пролистать за прогон.'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Число прогонов; в отчёт идёт медиана.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def seed(self, follows, posts_per_author, rng):
+        """Читатель, follows авторов и их посты с разбросанными датами."""
+        prefix = f'bench_{follows}'
+        reader = User.objects.create(username=f'{prefix}_reader')
+        User.objects.bulk_create(
+            User(username=f'{prefix}_author_{i}') for i in range(follows)
+        )
+        authors = list(User.objects.filter(
+            username__startswith=f'{prefix}_author_'
+        ))
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=author) for author in authors
+        )
+        Post.objects.bulk_create(
+            (Post(text='benchmark', author=author)
+             for author in authors for _ in range(posts_per_author)),
+            batch_size=500
+        )
+        # auto_now_add не даёт задать даты при вставке: проставляем их
+        # вторым проходом, чтобы посты авторов перемежались.
+        now = timezone.now()
+        posts = list(Post.objects.filter(author__in=authors).only('pk'))
+        for post in posts:
+            post.pub_date = now - timedelta(
+                minutes=rng.randrange(60 * 24 * 365)
+            )
+        Post.objects.bulk_update(posts, ['pub_date'], batch_size=500)
+        return reader
+
+    def walk(self, paginator, pages):
+        cursor = None
+        for _ in range(pages):
+            page = paginator.get_page(cursor)
+            list(page)
+            if not page.has_next():
+                return
+            cursor = page.next_cursor()
+
+    def measure(self, paginator, pages, repeat):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                self.walk(paginator, pages)
+                timings.append(time.perf_counter() - started)
+        return (statistics.median(timings) * 1000 / pages,
+                len(queries) / pages)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        pages, repeat = options['pages'], options['repeat']
+        self.stdout.write(
+            f'{"подписок":>9} {"join, мс":>10} {"merge, мс":>10} '
+            f'{"запросов join/merge":>20}'
+        )
+        try:
+            with transaction.atomic():
+                for follows in options['follows']:
+                    reader = self.seed(
+                        follows, options['posts_per_author'], rng
+                    )
+                    join = CursorPaginator(Post.objects.filter(
+                        author__following__user=reader
+                    ).for_feed(), COUNT_PUB)
+                    merge = MergeFeedPaginator(reader, COUNT_PUB)
+                    join_ms, join_queries = self.measure(join, pages, repeat)
+                    merge_ms, merge_queries = self.measure(
+                        merge, pages, repeat
+                    )
+                    self.stdout.write(
+                        f'{follows:>9} {join_ms:>10.2f} {merge_ms:>10.2f} '
+                        f'{f"{join_queries:g}/{merge_queries:g}":>20}'
+                    )
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(self.style.SUCCESS(
+            'Время и запросы — на одну страницу; данные откатены.'
+        ))
@@ -0,0 +1,158 @@
+import json
+import math
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import thumbnails
+from posts.models import Comment, Follow, Group, Post, PostStats, UserStats
+
+
+User = get_user_model()
+
+VIEWS = ('index', 'group_posts', 'profile', 'post_detail', 'follow_index')
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу: значение из самой выборки."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет p50/p95 времени ответа, число запросов к БД и размер '
+        'ответа основных страниц тестовым клиентом; результат — JSON '
+        'для сравнения прогонов между коммитами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'views',
+            nargs='*',
+            help=f'Какие страницы мерить: {", ".join(VIEWS)} (все).'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=50,
+            help='Замеряемых запросов на страницу.'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=5,
+            help='Незамеряемых запросов перед замером.'
+        )
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Очищать кэш и LRU миниатюр перед каждым запросом.'
+        )
+        parser.add_argument(
+            '--output', '-o',
+            help='Файл для JSON (по умолчанию стандартный вывод).'
+        )
+
+    def targets(self):
+        """{страница: (url, читатель или None)} на самых тяжёлых данных."""
+        author = UserStats.objects.order_by('-posts_count').first()
+        reader = UserStats.objects.order_by('-following_count').first()
+        post = PostStats.objects.order_by('-comments_count').first()
+        group = Group.objects.annotate(
+            posts_total=Count('posts')
+        ).order_by('-posts_total').first()
+        if not (author and reader and post and group):
+            raise CommandError(
+                'Нет данных для замера: сначала запустите seed_bench.'
+            )
+        return {
+            'index': (reverse('posts:index'), None),
+            'group_posts': (
+                reverse('posts:group_list', args=[group.slug]), None
+            ),
+            'profile': (
+                reverse('posts:profile', args=[author.user.username]), None
+            ),
+            'post_detail': (
+                reverse('posts:post_detail', args=[post.post_id]), None
+            ),
+            'follow_index': (reverse('posts:follow_index'), reader.user),
+        }
+
+    def measure(self, client, url, options):
+        timings, queries, sizes, statuses = [], [], [], set()
+        for number in range(options['warmup'] + options['requests']):
+            if options['cold']:
+                # caches.all() создал бы и неиспользуемые алиасы,
+                # например файл SQLite кэша 'shared'.
+                cache.clear()
+                thumbnails.resolved.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - started
+            if number < options['warmup']:
+                continue
+            timings.append(elapsed * 1000)
+            queries.append(len(captured))
+            sizes.append(len(response.content))
+            statuses.add(response.status_code)
+        return {
+            'url': url,
+            'status': sorted(statuses),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'queries_p50': percentile(queries, 50),
+            'queries_max': max(queries),
+            'bytes_p50': percentile(sizes, 50),
+        }
+
+    def handle(self, *args, **options):
+        names = options['views'] or list(VIEWS)
+        unknown = set(names) - set(VIEWS)
+        if unknown:
+            raise CommandError(f'Неизвестные страницы: {", ".join(unknown)}')
+        if options['requests'] < 1:
+            raise CommandError('Нужен хотя бы один замеряемый запрос.')
+        targets = self.targets()
+        results = {}
+        for name in names:
+            url, reader = targets[name]
+            client = Client()
+            if reader is not None:
+                client.force_login(reader)
+            results[name] = self.measure(client, url, options)
+        report = {
+            'settings': {
+                'POSTS_PAGINATION': settings.POSTS_PAGINATION,
+                'POSTS_FOLLOW_FEED': settings.POSTS_FOLLOW_FEED,
+                'POSTS_SEARCH_BACKEND': settings.POSTS_SEARCH_BACKEND,
+                'CACHE_BACKEND': settings.CACHES['default']['BACKEND'],
+            },
+            'dataset': {
+                'users': User.objects.count(),
+                'posts': Post.objects.count(),
+                'comments': Comment.objects.count(),
+                'follows': Follow.objects.count(),
+            },
+            'requests': options['requests'],
+            'cold': options['cold'],
+            'views': results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                stream.write(output + '\n')
+        else:
+            self.stdout.write(output)
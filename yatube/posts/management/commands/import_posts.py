@@ -0,0 +1,187 @@
+import gzip
+import json
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import counters, feed_cache, search, timeline
+from posts.models import Group, Post
+
+
+User = get_user_model()
+
+
+def create_posts(posts):
+    """bulk_create постов с их собственными pub_date; вызывать в транзакции.
+
+    auto_now_add ставит при вставке текущее время. Поле модели общее
+    для всего процесса (его видят запросы и потоки пула миниатюр),
+    поэтому оно не меняется: даты возвращаются вторым проходом
+    bulk_update.
+    """
+    dates = [post.pub_date for post in posts]
+    Post.objects.bulk_create(posts)
+    if posts and posts[0].pk is None:
+        # SQLite не возвращает id из bulk_create. Вставленные строки —
+        # последние по id: транзакция держит блокировку записи.
+        pks = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        )[:len(posts)]
+        for post, pk in zip(posts, reversed(pks)):
+            post.pk = pk
+    for post, pub_date in zip(posts, dates):
+        post.pub_date = pub_date
+    Post.objects.bulk_update(posts, ['pub_date'])
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует посты из JSONL (формат export_posts) пачками '
+        'bulk_create и затем разом пересобирает счётчики, поисковый '
+        'индекс и ленты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл JSONL (.gz — сжатый); «-» — стандартный ввод.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько постов вставлять в одной транзакции.'
+        )
+        parser.add_argument(
+            '--create-authors',
+            action='store_true',
+            help='Создавать неизвестных авторов без пароля.'
+        )
+
+    def open(self, path):
+        if path == '-':
+            return sys.stdin
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt', encoding='utf-8')
+        return open(path, encoding='utf-8')
+
+    def records(self, stream):
+        """Записи постов из потока; записи других моделей пропускаются."""
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                raise CommandError(f'Строка {number}: {error}')
+            if record.get('model', 'posts') == 'posts':
+                yield record
+
+    def resolve(self, cache, queryset, field, names):
+        """Дополняет cache {имя: id} одним запросом на пачку."""
+        missing = {name for name in names if name and name not in cache}
+        if missing:
+            cache.update(queryset.filter(**{
+                f'{field}__in': missing
+            }).values_list(field, 'pk'))
+        return missing - cache.keys()
+
+    def build(self, records):
+        """Несохранённые посты пачки и число пропущенных записей."""
+        unknown = self.resolve(
+            self.authors, User.objects, 'username',
+            [record.get('author') for record in records]
+        )
+        if unknown and self.create_authors:
+            User.objects.bulk_create(
+                User(username=name, password=make_password(None))
+                for name in unknown
+            )
+            self.resolve(self.authors, User.objects, 'username', unknown)
+        self.resolve(
+            self.groups, Group.objects, 'slug',
+            [record.get('group') for record in records]
+        )
+        posts = []
+        now = timezone.now()
+        for record in records:
+            author = self.authors.get(record.get('author'))
+            slug = record.get('group')
+            pub_date = now
+            if record.get('pub_date'):
+                try:
+                    pub_date = parse_datetime(record['pub_date'])
+                except ValueError:
+                    pub_date = None
+            if (not record.get('text') or author is None or pub_date is None
+                    or (slug and slug not in self.groups)):
+                continue
+            if timezone.is_naive(pub_date):
+                pub_date = timezone.make_aware(pub_date)
+            posts.append(Post(
+                text=record['text'],
+                author_id=author,
+                group_id=self.groups.get(slug),
+                pub_date=pub_date,
+                image=record.get('image') or '',
+            ))
+        return posts, len(records) - len(posts)
+
+    def rebuild(self, posts):
+        """Производные данные новых постов: bulk_create обходит сигналы."""
+        counters.recount_posts(posts)
+        counters.recount_users(
+            User.objects.filter(pk__in=posts.values('author_id'))
+        )
+        search.get_backend().index(posts)
+        if timeline.is_materialized():
+            timeline.fan_out_many(posts)
+        feed_cache.bump(feed_cache.ALL)
+
+    def handle(self, *args, **options):
+        self.authors, self.groups = {}, {}
+        self.create_authors = options['create_authors']
+        started = time.perf_counter()
+        last_pk = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        imported = skipped = 0
+        stream = self.open(options['path'])
+        try:
+            records = self.records(stream)
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                posts, rejected = self.build(batch)
+                with transaction.atomic():
+                    create_posts(posts)
+                imported += len(posts)
+                skipped += rejected
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        inserted = time.perf_counter() - started
+        posts = Post.objects.filter(pk__gt=last_pk)
+        with transaction.atomic():
+            self.rebuild(posts)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Вставка: {inserted:.2f} с, '
+            f'{imported / inserted if inserted else 0:.0f} строк/с'
+        )
+        if posts.exclude(image='').exists():
+            self.stdout.write(
+                'Миниатюры новых картинок готовит backfill_thumbnails.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано постов: {imported}, пропущено: {skipped}, '
+            f'всего {elapsed:.2f} с ({imported / elapsed:.0f} строк/с)'
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс постов пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=search.CHUNK_SIZE,
+            help='Сколько постов индексировать за одну пачку.'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = search.get_backend().rebuild(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано постов: {total}'
+        ))
@@ -0,0 +1,183 @@
+import random
+import time
+from datetime import timedelta
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+
+from posts import feed_cache, timeline
+from posts.management.commands.import_posts import create_posts
+from posts.models import Comment, Follow, Group, Post
+
+
+User = get_user_model()
+
+# Столько разных текстов генерирует Faker; дальше они переиспользуются,
+# иначе генерация текста стала бы дольше самой вставки.
+TEXT_POOL: int = 2000
+
+
+def skewed(rng, size):
+    """Индекс из range(size) со смещением к началу.
+
+    Квадрат равномерной величины даёт немногих популярных авторов
+    и длинный хвост, как в настоящих подписках.
+    """
+    return int(size * rng.random() ** 2)
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'комментариями и подписками для бенчмарков; при одном --seed '
+        'данные одинаковы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--comments', type=int, default=200_000)
+        parser.add_argument(
+            '--follows-per-user',
+            type=int,
+            default=50,
+            help='Среднее число подписок пользователя.'
+        )
+        parser.add_argument(
+            '--prefix',
+            default='bench',
+            help='Префикс имён пользователей и slug групп.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Сколько строк вставлять в одной транзакции.'
+        )
+
+    def insert(self, model, objects, create=None, **kwargs):
+        """bulk_create (или create) потока объектов пачками по транзакции."""
+        create = create or partial(model.objects.bulk_create, **kwargs)
+        total = 0
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                return total
+            with transaction.atomic():
+                create(batch)
+            total += len(batch)
+
+    def report(self, name, count):
+        self.stdout.write(
+            f'{name}: {count} за {time.perf_counter() - self.started:.1f} с'
+        )
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix!r} уже есть: '
+                'возьмите чистую базу или другой --prefix.'
+            )
+        rng = random.Random(options['seed'])
+        fake = Faker('ru_RU')
+        fake.seed_instance(options['seed'])
+        texts = [fake.paragraph(nb_sentences=3) for _ in range(TEXT_POOL)]
+        self.batch_size = options['batch_size']
+        self.started = time.perf_counter()
+
+        # Хэш пароля считается один раз: make_password на каждого
+        # пользователя занял бы больше времени, чем всё остальное.
+        password = make_password(None)
+        self.report('Пользователей', self.insert(User, (
+            User(
+                username=f'{prefix}_{i}',
+                first_name=fake.first_name(),
+                last_name=fake.last_name(),
+                password=password,
+            )
+            for i in range(options['users'])
+        )))
+        users = list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).order_by('pk').values_list('pk', flat=True))
+        self.report('Групп', self.insert(Group, (
+            Group(
+                title=fake.catch_phrase()[:200],
+                slug=f'{prefix}-{i}',
+                description=rng.choice(texts),
+            )
+            for i in range(options['groups'])
+        )))
+        groups = list(Group.objects.filter(
+            slug__startswith=f'{prefix}-'
+        ).order_by('pk').values_list('pk', flat=True))
+
+        def follows():
+            for user in users:
+                count = rng.randint(0, 2 * options['follows_per_user'])
+                authors = {users[skewed(rng, len(users))]
+                           for _ in range(count)}
+                authors.discard(user)
+                for author in authors:
+                    yield Follow(user_id=user, author_id=author)
+
+        self.report('Подписок', self.insert(
+            Follow, follows(), ignore_conflicts=True
+        ))
+
+        now = timezone.now()
+        last_pk = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        self.report('Постов', self.insert(Post, (
+            Post(
+                text=rng.choice(texts),
+                author_id=users[skewed(rng, len(users))],
+                group_id=(rng.choice(groups)
+                          if groups and rng.random() < 0.7 else None),
+                pub_date=now - timedelta(
+                    seconds=rng.randrange(60 * 60 * 24 * 365)
+                ),
+            )
+            for _ in range(options['posts'])
+        ), create=create_posts))
+        # id читаются обратно: AUTOINCREMENT SQLite продолжает
+        # sqlite_sequence, и после удаления последних постов новые id
+        # начинаются не с max(pk) + 1.
+        posts = list(Post.objects.filter(pk__gt=last_pk).order_by(
+            'pk'
+        ).values_list('pk', flat=True))
+        if posts:
+            self.report('Комментариев', self.insert(Comment, (
+                Comment(
+                    post_id=rng.choice(posts),
+                    author_id=users[rng.randrange(len(users))],
+                    text=rng.choice(texts),
+                )
+                for _ in range(options['comments'])
+            )))
+
+        # bulk_create обходит сигналы: производные данные собираем разом.
+        call_command('recount', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        if timeline.is_materialized():
+            call_command('rebuild_timelines', stdout=self.stdout)
+        feed_cache.bump(feed_cache.ALL)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - self.started:.1f} с '
+            f'(лента подписок: {settings.POSTS_FOLLOW_FEED})'
+        ))
@@ -0,0 +1,118 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Follow, Post
+from .paginators import AFTER, CursorPage, encode_cursor, parse_cursor
+
+
+# Авторов в одном UNION ALL: по пять параметров на автора укладываются
+# в лимит SQLite на число параметров запроса.
+CHUNK_SIZE: int = 100
+
+
+def is_enabled():
+    """Лента подписок собирается слиянием диапазонов авторов."""
+    return settings.POSTS_FOLLOW_FEED == 'merge'
+
+
+class MergeFeedPaginator:
+    """Лента подписок как k-путевое слияние диапазонов авторов.
+
+    Для каждого автора из подписок читается не больше per_page + 1
+    ключей (pub_date, id) по индексу post_author_date_idx, который их
+    покрывает, так что до самой таблицы постов запросы не доходят.
+    Авторы обрабатываются пачками по CHUNK_SIZE в одном UNION ALL;
+    после первой пачки ключи не лучше текущего k-го отсекаются ещё
+    в SQL. Ключи сливаются heapq.merge, и полные посты
+    страницы выбираются одним запросом.
+    """
+
+    def __init__(self, user, per_page):
+        self.user = user
+        self.per_page = per_page
+
+    def cursor_for(self, post, direction):
+        return encode_cursor(direction, post.pub_date.isoformat(), post.pk)
+
+    def _bound(self, cursor):
+        try:
+            direction, pub_date, pk = parse_cursor(cursor or '')
+        except ValueError:
+            return None, None
+        return direction, (
+            connection.ops.adapt_datetimefield_value(pub_date), pk
+        )
+
+    def _ranges(self, authors, descending, lower, upper, limit):
+        """Списки ключей (pub_date, id) авторов, каждый по порядку.
+
+        pub_date остаётся строкой в формате БД: так ключи сравниваются
+        и в Python, и в SQL одинаково.
+        """
+        table = Post._meta.db_table
+        parts, params = [], []
+        for author in authors:
+            where, where_params = ['author_id = %s'], [author]
+            if lower is not None:
+                where.append('(pub_date, id) > (%s, %s)')
+                where_params += lower
+            if upper is not None:
+                where.append('(pub_date, id) < (%s, %s)')
+                where_params += upper
+            order = 'DESC' if descending else 'ASC'
+            parts.append(
+                f'SELECT * FROM (SELECT author_id, '
+                f'CAST(pub_date AS TEXT), id '
+                f'FROM {table} WHERE {" AND ".join(where)} '
+                f'ORDER BY pub_date {order}, id {order} LIMIT %s)'
+            )
+            params += where_params + [limit]
+        ranges = {author: [] for author in authors}
+        with connection.cursor() as cursor:
+            cursor.execute(' UNION ALL '.join(parts), params)
+            for author, pub_date, pk in cursor.fetchall():
+                ranges[author].append((pub_date, pk))
+        return ranges.values()
+
+    def _merge(self, descending, bound):
+        """Первые per_page + 1 ключей ленты за границей bound."""
+        authors = list(Follow.objects.filter(
+            user=self.user
+        ).order_by('author_id').values_list('author_id', flat=True))
+        limit = self.per_page + 1
+        best = []
+        for start in range(0, len(authors), CHUNK_SIZE):
+            # Ключ хуже k-го из уже найденных на страницу не попадёт.
+            threshold = best[-1] if len(best) == limit else None
+            if descending:
+                lower, upper = threshold, bound
+            else:
+                lower, upper = bound, threshold
+            ranges = self._ranges(
+                authors[start:start + CHUNK_SIZE],
+                descending, lower, upper, limit
+            )
+            best = list(islice(
+                heapq.merge(best, *ranges, reverse=descending), limit
+            ))
+        return best
+
+    def get_page(self, cursor):
+        direction, bound = self._bound(cursor)
+        if direction is None:
+            keys = self._merge(True, None)
+            has_next, has_previous = len(keys) > self.per_page, False
+        elif direction == AFTER:
+            keys = self._merge(True, bound)
+            has_next, has_previous = len(keys) > self.per_page, True
+        else:
+            keys = self._merge(False, bound)
+            has_next, has_previous = True, len(keys) > self.per_page
+            keys = keys[:self.per_page][::-1]
+        keys = keys[:self.per_page]
+        posts = Post.objects.for_feed().in_bulk([pk for _, pk in keys])
+        object_list = [posts[pk] for _, pk in keys if pk in posts]
+        return CursorPage(object_list, self, has_next, has_previous)
@@ -0,0 +1,74 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def _count(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def fill_stats(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    PostStats = apps.get_model('posts', 'PostStats')
+    UserStats.objects.bulk_create((
+        UserStats(
+            user_id=user['pk'],
+            posts_count=user['posts_total'],
+            followers_count=user['followers_total'],
+            following_count=user['following_total'],
+        )
+        for user in User.objects.annotate(
+            posts_total=_count(Post, 'author'),
+            followers_total=_count(Follow, 'author'),
+            following_total=_count(Follow, 'user'),
+        ).values(
+            'pk', 'posts_total', 'followers_total', 'following_total'
+        ).iterator()
+    ), batch_size=500)
+    PostStats.objects.bulk_create((
+        PostStats(post_id=post['pk'], comments_count=post['comments_total'])
+        for post in Post.objects.annotate(
+            comments_total=_count(Comment, 'post'),
+        ).values('pk', 'comments_total').iterator()
+    ), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostStats',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Post')),
+                ('comments_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('followers_count', models.PositiveIntegerField(default=0)),
+                ('following_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
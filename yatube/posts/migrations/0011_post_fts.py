@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+def create_fts(apps, schema_editor):
+    # FTS5 есть только в SQLite; на других СУБД используйте
+    # posts.search.SimpleSearchBackend.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts USING fts5('
+        'text, username, group_title, tokenize = "unicode61")'
+    )
+    Post = apps.get_model('posts', 'Post')
+    rows = Post.objects.values_list(
+        'pk', 'text', 'author__username', 'group__title'
+    ).order_by()
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO posts_post_fts (rowid, text, username, group_title) '
+            'VALUES (%s, %s, %s, %s)',
+            [(pk, text, username, title or '')
+             for pk, text, username, title in rows.iterator()]
+        )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
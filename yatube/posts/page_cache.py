@@ -0,0 +1,62 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from . import feed_cache
+
+
+PREFIX = 'page'
+
+
+def _key(request):
+    url = request.build_absolute_uri().encode()
+    return f'{PREFIX}:{hashlib.md5(url).hexdigest()}'
+
+
+def _cacheable(request):
+    return request.method == 'GET' and not request.user.is_authenticated
+
+
+def tag(request, *feeds):
+    """Помечает ответ тегами-лентами из feed_cache.
+
+    Вызывается до выборки содержимого страницы: версия снимается
+    сразу, и пост, сохранённый во время отрисовки, сдвинет поколение
+    позже снимка — такая страница не переживёт следующего запроса.
+    """
+    if _cacheable(request):
+        request.page_cache_tags = (feeds, feed_cache.version(*feeds))
+
+
+def cache_anonymous_page(view):
+    """Кэширует ответы view для анонимных GET-запросов.
+
+    Страница хранится вместе с версией своих тегов (см. tag()) и
+    отдаётся, пока эта версия совпадает с текущей. Сигналы моделей
+    и готовность миниатюр (thumbnails_ready) сдвигают поколения тегов,
+    так что TTL лишь ограничивает память.
+    Ответы без тегов не кэшируются.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _cacheable(request):
+            return view(request, *args, **kwargs)
+        key = _key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            feeds, version, content, content_type = entry
+            if feed_cache.version(*feeds) == version:
+                return HttpResponse(content, content_type=content_type)
+        response = view(request, *args, **kwargs)
+        tags = getattr(request, 'page_cache_tags', None)
+        if tags is not None and response.status_code == 200:
+            cache.set(
+                key,
+                (*tags, response.content, response['Content-Type']),
+                settings.POSTS_PAGE_CACHE_TTL
+            )
+        return response
+    return wrapper
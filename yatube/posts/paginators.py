@@ -0,0 +1,185 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+AFTER = 'a'
+BEFORE = 'b'
+
+# Допустимые id: знаковое 64-битное целое, как INTEGER в SQLite
+# и BIGINT в других СУБД.
+PK_RANGE = range(-2 ** 63, 2 ** 63)
+
+
+def encode_cursor(direction, key, pk):
+    """Упаковывает ключ сортировки и id в непрозрачный токен."""
+    raw = f'{direction}|{key}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Распаковывает токен курсора, ValueError для битых токенов.
+
+    Ключ сортировки возвращается строкой: разбирать его должен
+    паджинатор, который этот токен выдал.
+    """
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, key, pk = raw.split('|')
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f'Некорректный курсор: {cursor!r}')
+    if direction not in (AFTER, BEFORE) or pk not in PK_RANGE:
+        raise ValueError(f'Некорректный курсор: {cursor!r}')
+    return direction, key, pk
+
+
+def parse_cursor(cursor):
+    """decode_cursor с разобранной датой, ValueError для битых токенов.
+
+    Паджинаторы выдают ключи с часовым поясом; наивная или
+    несуществующая дата в токене означает, что он собран вручную.
+    """
+    direction, pub_date, pk = decode_cursor(cursor)
+    try:
+        pub_date = parse_datetime(pub_date)
+    except (ValueError, OverflowError):
+        pub_date = None
+    if pub_date is None or (
+        settings.USE_TZ and timezone.is_naive(pub_date)
+    ):
+        raise ValueError(f'Некорректный курсор: {cursor!r}')
+    return direction, pub_date, pk
+
+
+class CursorPage(Page):
+    """Страница ленты, адресуемая курсором, а не номером.
+
+    Не знает ни своего номера, ни общего числа страниц: это и позволяет
+    обойтись без COUNT(*) и OFFSET.
+    """
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        # repr участвует в ключах {% cache %}, поэтому он должен
+        # различать страницы и не обращаться к paginator.count.
+        return f'<CursorPage {self.start_cursor()}:{self.end_cursor()}>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def start_cursor(self):
+        if not self:
+            return ''
+        return self.paginator.cursor_for(self[0], BEFORE)
+
+    def end_cursor(self):
+        if not self:
+            return ''
+        return self.paginator.cursor_for(self[len(self) - 1], AFTER)
+
+    def next_cursor(self):
+        return self.end_cursor() if self._has_next else None
+
+    def previous_cursor(self):
+        return self.start_cursor() if self._has_previous else None
+
+
+class CursorPaginator(Paginator):
+    """Keyset-паджинатор по (-pub_date, -id) или другой паре keys.
+
+    Любая страница выбирается одним индексным диапазоном с LIMIT,
+    поэтому страница N стоит столько же, сколько первая. keys задаёт
+    поля, по которым идёт сравнение и сортировка: для материализованной
+    ленты это денормализованные копии pub_date и id в её таблице.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'pk')):
+        self.date_key, self.pk_key = keys
+        super().__init__(
+            object_list.order_by(f'-{self.date_key}', f'-{self.pk_key}'),
+            per_page
+        )
+
+    def cursor_for(self, obj, direction):
+        return encode_cursor(
+            direction,
+            getattr(obj, self.date_key).isoformat(),
+            getattr(obj, self.pk_key)
+        )
+
+    def get_page(self, cursor):
+        try:
+            direction, pub_date, pk = parse_cursor(cursor or '')
+        except ValueError:
+            return self._first_page()
+        if direction == AFTER:
+            return self._page_after(pub_date, pk)
+        return self._page_before(pub_date, pk)
+
+    def _first_page(self):
+        rows = list(self.object_list[:self.per_page + 1])
+        return CursorPage(
+            rows[:self.per_page], self,
+            has_next=len(rows) > self.per_page,
+            has_previous=False,
+        )
+
+    def _page_after(self, pub_date, pk):
+        rows = list(self.object_list.filter(
+            Q(**{f'{self.date_key}__lt': pub_date})
+            | Q(**{self.date_key: pub_date, f'{self.pk_key}__lt': pk})
+        )[:self.per_page + 1])
+        return CursorPage(
+            rows[:self.per_page], self,
+            has_next=len(rows) > self.per_page,
+            has_previous=True,
+        )
+
+    def _page_before(self, pub_date, pk):
+        rows = list(self.object_list.filter(
+            Q(**{f'{self.date_key}__gt': pub_date})
+            | Q(**{self.date_key: pub_date, f'{self.pk_key}__gt': pk})
+        ).order_by(self.date_key, self.pk_key)[:self.per_page + 1])
+        return CursorPage(
+            rows[:self.per_page][::-1], self,
+            has_next=True,
+            has_previous=len(rows) > self.per_page,
+        )
+
+
+def paginate(request, queryset, per_page, keys=('pub_date', 'pk'),
+             count=None):
+    """Возвращает страницу ленты для запроса.
+
+    Параметр ?cursor= всегда включает keyset-режим; без него режим
+    по умолчанию задаёт settings.POSTS_PAGINATION, а ?page= оставляет
+    классическую offset-паджинацию для совместимости со старыми ссылками.
+    Известное заранее число записей (count) избавляет offset-режим
+    от COUNT(*).
+    """
+    cursor = request.GET.get('cursor')
+    page_number = request.GET.get('page')
+    if cursor is not None or (
+        settings.POSTS_PAGINATION == 'cursor' and page_number is None
+    ):
+        return CursorPaginator(queryset, per_page, keys).get_page(cursor)
+    paginator = Paginator(queryset, per_page)
+    if count is not None:
+        paginator.count = count
+    return paginator.get_page(page_number)
@@ -0,0 +1,205 @@
+import re
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Post
+from .paginators import AFTER, CursorPage, decode_cursor, encode_cursor
+
+
+FTS_TABLE = 'posts_post_fts'
+
+CHUNK_SIZE: int = 1000
+
+
+def get_backend():
+    """Экземпляр бэкенда из settings.POSTS_SEARCH_BACKEND."""
+    return import_string(settings.POSTS_SEARCH_BACKEND)()
+
+
+def _chunks(iterable, size):
+    iterable = iter(iterable)
+    while True:
+        chunk = list(islice(iterable, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class SimpleSearchBackend:
+    """Поиск через LIKE по всем постам.
+
+    Индекса не держит и работает на любой СУБД, но сканирует таблицу
+    целиком; годится для разработки и как запасной вариант.
+    """
+
+    def index(self, posts):
+        pass
+
+    def remove(self, post_ids):
+        pass
+
+    def rebuild(self, chunk_size=CHUNK_SIZE):
+        return 0
+
+    def _lookup(self, query):
+        return (Q(text__icontains=query)
+                | Q(author__username__icontains=query)
+                | Q(group__title__icontains=query))
+
+    def filter(self, queryset, query):
+        return queryset.filter(self._lookup(query))
+
+    def search(self, query, limit, after=None, before=None):
+        """Список (score, id) по возрастанию (score, id).
+
+        У LIKE нет ранжирования, поэтому score всегда 0.
+        """
+        posts = Post.objects.filter(self._lookup(query))
+        if after is not None:
+            posts = posts.filter(pk__gt=after[1]).order_by('pk')
+        elif before is not None:
+            posts = posts.filter(pk__lt=before[1]).order_by('-pk')
+        else:
+            posts = posts.order_by('pk')
+        return [(0.0, pk) for pk in posts.values_list('pk', flat=True)[:limit]]
+
+
+class FTS5SearchBackend:
+    """Полнотекстовый поиск на виртуальной таблице SQLite FTS5.
+
+    Таблица posts_post_fts создаётся миграцией и хранит текст поста,
+    имя автора и название группы с rowid = id поста. Результаты
+    ранжируются bm25(): чем меньше score, тем релевантнее.
+    """
+
+    def match_expression(self, query):
+        # Пользовательский ввод не должен попадать в синтаксис MATCH:
+        # каждое слово берём в кавычки и ищем как префикс.
+        words = re.findall(r'\w+', query)
+        return ' '.join('"{}"*'.format(word) for word in words)
+
+    def index(self, posts):
+        rows = posts.values_list(
+            'pk', 'text', 'author__username', 'group__title'
+        ).order_by()
+        with connection.cursor() as cursor:
+            for chunk in _chunks(rows.iterator(), CHUNK_SIZE):
+                cursor.executemany(
+                    f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                    [(row[0],) for row in chunk]
+                )
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE} '
+                    f'(rowid, text, username, group_title) '
+                    f'VALUES (%s, %s, %s, %s)',
+                    [(pk, text, username, title or '')
+                     for pk, text, username, title in chunk]
+                )
+
+    def remove(self, post_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(pk,) for pk in post_ids]
+            )
+
+    def rebuild(self, chunk_size=CHUNK_SIZE):
+        """Переиндексирует все посты пачками по id, возвращает их число."""
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        total = 0
+        last_pk = 0
+        while True:
+            ids = list(Post.objects.filter(pk__gt=last_pk).order_by(
+                'pk'
+            ).values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                return total
+            self.index(Post.objects.filter(pk__in=ids))
+            total += len(ids)
+            last_pk = ids[-1]
+
+    def filter(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (expression,)
+        ))
+
+    def search(self, query, limit, after=None, before=None):
+        """Список (score, id) по возрастанию (score, id).
+
+        after/before — ключ (score, id), от которого продолжается
+        выдача; для before строки возвращаются в обратном порядке.
+        """
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        sql = (
+            f'SELECT score, rowid FROM ('
+            f'SELECT rowid, bm25({FTS_TABLE}) AS score FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s)'
+        )
+        params = [expression]
+        if after is not None:
+            sql += (' WHERE score > %s OR (score = %s AND rowid > %s)'
+                    ' ORDER BY score, rowid')
+            params += [after[0], after[0], after[1]]
+        elif before is not None:
+            sql += (' WHERE score < %s OR (score = %s AND rowid < %s)'
+                    ' ORDER BY score DESC, rowid DESC')
+            params += [before[0], before[0], before[1]]
+        else:
+            sql += ' ORDER BY score, rowid'
+        sql += ' LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class SearchPaginator:
+    """Курсорная выдача поиска по ключу (score, id)."""
+
+    def __init__(self, query, per_page, backend=None):
+        self.query = query
+        self.per_page = per_page
+        self.backend = backend or get_backend()
+
+    def cursor_for(self, post, direction):
+        return encode_cursor(direction, repr(post.search_score), post.pk)
+
+    def get_page(self, cursor):
+        try:
+            direction, score, pk = decode_cursor(cursor or '')
+            key = (float(score), pk)
+        except ValueError:
+            direction, key = None, None
+        limit = self.per_page + 1
+        if direction is None:
+            rows = self.backend.search(self.query, limit)
+            has_next, has_previous = len(rows) > self.per_page, False
+        elif direction == AFTER:
+            rows = self.backend.search(self.query, limit, after=key)
+            has_next, has_previous = len(rows) > self.per_page, True
+        else:
+            rows = self.backend.search(self.query, limit, before=key)
+            has_next, has_previous = True, len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+        rows = rows[:self.per_page]
+        posts = Post.objects.for_feed().in_bulk(
+            [pk for _, pk in rows]
+        )
+        object_list = []
+        for score, pk in rows:
+            if pk in posts:
+                posts[pk].search_score = score
+                object_list.append(posts[pk])
+        return CursorPage(object_list, self, has_next, has_previous)
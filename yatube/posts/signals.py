@@ -0,0 +1,208 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core import thumbnails
+
+from . import counters, feed_cache, search, timeline
+from .models import Comment, Follow, Group, Post, PostStats, User, UserStats
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        PostStats.objects.get_or_create(post=instance)
+        counters.bump_user(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.bump_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, followers_count=1)
+        counters.bump_user(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, followers_count=-1)
+    counters.bump_user(instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.get_backend().index(Post.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.get_backend().remove([instance.pk])
+
+
+# Имена автора, которые видны в карточках постов.
+NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def remember_user_names(sender, instance, update_fields, **kwargs):
+    # Вход, смена пароля и правки в админке сохраняют пользователя
+    # целиком; индекс и кэши лент зависят только от имён.
+    instance._old_names = None
+    if instance.pk and not (
+        update_fields and not set(NAME_FIELDS) & set(update_fields)
+    ):
+        instance._old_names = User.objects.filter(pk=instance.pk).values(
+            *NAME_FIELDS
+        ).first()
+
+
+def _names_changed(instance, *fields):
+    old = getattr(instance, '_old_names', None)
+    return bool(old) and any(
+        old[field] != getattr(instance, field) for field in fields
+    )
+
+
+@receiver(post_save, sender=User)
+def reindex_author_posts(sender, instance, **kwargs):
+    if _names_changed(instance, 'username'):
+        search.get_backend().index(instance.posts.all())
+
+
+@receiver(post_save, sender=Group)
+def reindex_group_posts(sender, instance, created, **kwargs):
+    if not created:
+        search.get_backend().index(instance.posts.all())
+
+
+# Материализованные ленты обновляются при любой записи: из views,
+# админки или shell. bulk_create сигналов не шлёт, поэтому import_posts
+# раскладывает посты сам (timeline.fan_out_many).
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created and timeline.is_materialized():
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created and timeline.is_materialized():
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    if timeline.is_materialized():
+        timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def queue_post_thumbnails(sender, instance, **kwargs):
+    thumbnails.queue(instance.image)
+
+
+def _post_feeds(post_id, group_id, author_id):
+    feeds = [
+        feed_cache.INDEX,
+        feed_cache.post_feed(post_id),
+        feed_cache.author_feed(author_id),
+    ]
+    if group_id:
+        feeds.append(feed_cache.group_feed(group_id))
+    return feeds
+
+
+@receiver(thumbnails.thumbnails_ready)
+def invalidate_thumbnail_feeds(sender, name, **kwargs):
+    # Карточки и страницы с этой картинкой кэшировались с оригиналом
+    # вместо миниатюры: сдвигаем их ленты.
+    feeds = []
+    for post in Post.objects.filter(image=name).values_list(
+        'pk', 'group_id', 'author_id'
+    ):
+        feeds += _post_feeds(*post)
+    feed_cache.bump(*feeds)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_feeds(sender, instance, **kwargs):
+    # Пост мог сменить группу или автора: старые ленты тоже устаревают.
+    instance._old_feeds = []
+    if instance.pk:
+        old = Post.objects.filter(pk=instance.pk).values_list(
+            'pk', 'group_id', 'author_id'
+        ).first()
+        if old:
+            instance._old_feeds = _post_feeds(*old)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_feeds(sender, instance, **kwargs):
+    feed_cache.bump(
+        *_post_feeds(instance.pk, instance.group_id, instance.author_id),
+        *getattr(instance, '_old_feeds', ()),
+    )
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_feeds(sender, instance, **kwargs):
+    feed_cache.bump(
+        *_post_feeds(instance.pk, instance.group_id, instance.author_id)
+    )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_feeds(sender, instance, **kwargs):
+    # При каскадном удалении поста его строки уже нет, а ленты
+    # сдвинул сигнал самого поста.
+    post = Post.objects.filter(pk=instance.post_id).values_list(
+        'pk', 'group_id', 'author_id'
+    ).first()
+    if post:
+        feed_cache.bump(*_post_feeds(*post))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_profiles(sender, instance, **kwargs):
+    # Профили показывают число подписчиков и подписок.
+    feed_cache.bump(
+        feed_cache.author_feed(instance.author_id),
+        feed_cache.author_feed(instance.user_id),
+    )
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_name(sender, instance, **kwargs):
+    if _names_changed(instance, *NAME_FIELDS):
+        feed_cache.bump(feed_cache.ALL)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, instance, **kwargs):
+    # Slug группы есть в карточках всех лент, а удаление группы
+    # обнуляет group у постов без сигналов.
+    if not kwargs.get('created'):
+        feed_cache.bump(feed_cache.ALL)
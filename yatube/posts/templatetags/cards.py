@@ -0,0 +1,11 @@
+from django import template
+
+from posts.cards import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(page):
+    """Пары (пост, карточка) страницы из кэша карточек."""
+    return render_cards(page)
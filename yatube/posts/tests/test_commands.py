@@ -0,0 +1,345 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core import thumbnails
+from core.cache import SQLiteCache
+from posts import feed_cache, search
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry,
+                          UserStats)
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+class ExportPostsCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='auth_user')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='test title',
+            description='test description',
+            slug='test-slug',
+        )
+        cls.post = Post.objects.create(
+            text='Тестовый пост', author=cls.author, group=cls.group
+        )
+        cls.old_post = Post.objects.create(text='old', author=cls.other)
+        Post.objects.filter(pk=cls.old_post.pk).update(
+            pub_date=timezone.now() - timedelta(days=30)
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.other, text='comment'
+        )
+        Follow.objects.create(user=cls.other, author=cls.author)
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_posts', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def records(self, *args):
+        return [json.loads(line) for line in self.export(*args).splitlines()]
+
+    def test_jsonl_exports_every_model(self):
+        """Без аргументов выгружаются все модели, по записи на строку."""
+        models = [record['model'] for record in self.records()]
+        self.assertEqual(models.count('posts'), 2)
+        self.assertEqual(models.count('comments'), 1)
+        self.assertEqual(models.count('groups'), 1)
+        self.assertEqual(models.count('follows'), 1)
+        post = self.records('posts', '--author', 'auth_user')[0]
+        self.assertEqual(post['text'], 'Тестовый пост')
+        self.assertEqual(post['author'], 'auth_user')
+        self.assertEqual(post['group'], 'test-slug')
+
+    def test_filters(self):
+        """--since/--until, --author и --group сужают выгрузку."""
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        self.assertEqual(
+            [r['id'] for r in self.records('posts', '--since', since)],
+            [self.post.pk]
+        )
+        self.assertEqual(
+            [r['id'] for r in self.records('posts', '--until', since)],
+            [self.old_post.pk]
+        )
+        self.assertEqual(
+            [r['id'] for r in self.records('posts', '--author', 'other')],
+            [self.old_post.pk]
+        )
+        self.assertEqual(
+            len(self.records('comments', '--group', 'test-slug')), 1
+        )
+        self.assertEqual(
+            self.records('comments', '--author', 'other'), []
+        )
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO(
+            self.export('posts', '--format', 'csv')
+        )))
+        self.assertEqual(rows[0][:3], ['id', 'author', 'group'])
+        self.assertEqual(len(rows), 3)
+        with self.assertRaises(CommandError):
+            self.export('posts', 'comments', '--format', 'csv')
+
+    def test_gzip_output(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'posts.jsonl.gz')
+            self.export('posts', '--output', path)
+            with gzip.open(path, 'rt', encoding='utf-8') as stream:
+                self.assertEqual(len(stream.read().splitlines()), 2)
+        with self.assertRaises(CommandError):
+            self.export('posts', '--gzip')
+
+    def test_single_query_per_model(self):
+        """Строки читаются потоком одного запроса, без join по моделям."""
+        with CaptureQueriesContext(connection) as queries:
+            self.export('posts', '--chunk-size', '1')
+        self.assertEqual(len(queries), 1)
+
+
+class ImportPostsCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='auth_user')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test title',
+            description='test description',
+            slug='test-slug',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, records, name='posts.jsonl.gz'):
+        path = os.path.join(self.directory.name, name)
+        with gzip.open(path, 'wt', encoding='utf-8') as stream:
+            for record in records:
+                stream.write(json.dumps(record) + '\n')
+        return path
+
+    def run_import(self, *args):
+        out = StringIO()
+        call_command('import_posts', *args, stdout=out)
+        return out.getvalue()
+
+    def test_round_trip_with_export(self):
+        """Выгрузка export_posts загружается обратно с теми же датами."""
+        post = Post.objects.create(
+            text='exported', author=self.author, group=self.group
+        )
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=timezone.now() - timedelta(days=3)
+        )
+        path = os.path.join(self.directory.name, 'dump.jsonl')
+        call_command(
+            'export_posts', '--output', path,
+            stdout=StringIO(), stderr=StringIO()
+        )
+        output = self.run_import(path)
+        self.assertIn('Импортировано постов: 1, пропущено: 0', output)
+        original, copy = Post.objects.filter(text='exported').order_by('pk')
+        self.assertEqual(copy.pub_date, original.pub_date)
+        self.assertEqual(copy.group, self.group)
+
+    @override_settings(POSTS_FOLLOW_FEED='materialized')
+    def test_rebuilds_derived_data(self):
+        """Счётчики, поиск, ленты и кэш лент обновляются после вставки."""
+        generation = feed_cache.generation(feed_cache.ALL)
+        path = self.write([
+            {'text': f'imported {i}', 'author': 'auth_user',
+             'group': 'test-slug'}
+            for i in range(5)
+        ])
+        self.run_import(path, '--batch-size', '2')
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 5
+        )
+        self.assertEqual(
+            Post.objects.filter(stats__comments_count=0).count(), 5
+        )
+        self.assertEqual(
+            len(search.get_backend().search('imported', 10)), 5
+        )
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 5
+        )
+        self.assertNotEqual(
+            feed_cache.generation(feed_cache.ALL), generation
+        )
+
+    def test_malformed_date_skipped(self):
+        """Запись с несуществующей датой пропускается, а не рвёт импорт."""
+        path = self.write([
+            {'text': 'bad date', 'author': 'auth_user',
+             'pub_date': '2020-13-45T00:00:00+00:00'},
+            {'text': 'good date', 'author': 'auth_user',
+             'pub_date': '2020-01-02T03:04:05+00:00'},
+        ])
+        self.assertIn(
+            'Импортировано постов: 1, пропущено: 1', self.run_import(path)
+        )
+        self.assertEqual(
+            Post.objects.get(text='good date').pub_date.isoformat(),
+            '2020-01-02T03:04:05+00:00'
+        )
+
+    def test_unknown_references(self):
+        """Записи с неизвестной группой или автором пропускаются."""
+        path = self.write([
+            {'text': 'no group', 'author': 'auth_user', 'group': 'missing'},
+            {'text': 'new author', 'author': 'newcomer'},
+            {'model': 'comments', 'text': 'not a post'},
+        ])
+        self.assertIn('пропущено: 2', self.run_import(path))
+        self.assertIn(
+            'Импортировано постов: 1',
+            self.run_import(path, '--create-authors')
+        )
+        newcomer = User.objects.get(username='newcomer')
+        self.assertFalse(newcomer.has_usable_password())
+        self.assertEqual(newcomer.stats.posts_count, 1)
+
+
+class SeedBenchCommandTest(TestCase):
+    def seed(self, *args):
+        call_command(
+            'seed_bench', '--users', '20', '--posts', '200', '--groups', '3',
+            '--comments', '50', '--follows-per-user', '5', *args,
+            stdout=StringIO()
+        )
+
+    def test_seed_is_deterministic(self):
+        self.seed('--seed', '7')
+        first = list(Post.objects.order_by('pk').values_list(
+            'text', 'author__username', 'group__slug', 'pub_date__date'
+        ))
+        self.assertEqual(len(first), 200)
+        self.assertEqual(Comment.objects.count(), 50)
+        self.assertTrue(Follow.objects.exists())
+        self.assertEqual(
+            UserStats.objects.filter(posts_count__gt=0).count(),
+            Post.objects.values('author').distinct().count()
+        )
+        with self.assertRaises(CommandError):
+            self.seed('--seed', '7')
+        self.seed('--seed', '7', '--prefix', 'again')
+        second = list(Post.objects.filter(
+            author__username__startswith='again_'
+        ).order_by('pk').values_list(
+            'text', 'author__username', 'group__slug', 'pub_date__date'
+        ))
+        self.assertEqual(
+            [row[0] for row in first], [row[0] for row in second]
+        )
+
+    def test_comments_reference_seeded_posts(self):
+        """Комментарии ссылаются на новые посты и после удаления старых."""
+        author = User.objects.create_user(username='gone')
+        Post.objects.bulk_create(
+            Post(text='deleted', author=author) for _ in range(100)
+        )
+        Post.objects.all().delete()
+        self.seed()
+        self.assertEqual(Comment.objects.count(), 50)
+        self.assertFalse(Comment.objects.exclude(
+            post_id__in=Post.objects.values('pk')
+        ).exists())
+
+    def test_benchmark_views_reports_json(self):
+        self.seed()
+        out = StringIO()
+        call_command(
+            'benchmark_views', '--requests', '3', '--warmup', '1',
+            stdout=out
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['dataset']['posts'], 200)
+        self.assertEqual(set(report['views']), {
+            'index', 'group_posts', 'profile', 'post_detail',
+            'follow_index',
+        })
+        for result in report['views'].values():
+            self.assertEqual(result['status'], [200])
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertGreater(result['bytes_p50'], 0)
+
+    def test_benchmark_cold_clears_default_cache_only(self):
+        """--cold не создаёт файл кэша 'shared' и сбрасывает LRU."""
+        self.seed()
+        with mock.patch.object(SQLiteCache, 'clear') as shared_clear, \
+                mock.patch.object(thumbnails.resolved, 'clear') as lru_clear:
+            call_command(
+                'benchmark_views', '--requests', '1', '--warmup', '0',
+                '--cold', stdout=StringIO()
+            )
+        shared_clear.assert_not_called()
+        self.assertEqual(lru_clear.call_count, 5)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=2)
+class BackfillThumbnailsCommandTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Пул миниатюр не запускается: on_commit в TestCase не срабатывает
+        author = User.objects.create_user(username='auth_user')
+        self.posts = [
+            Post.objects.create(
+                text=f'post {i}', author=author,
+                image=SimpleUploadedFile(
+                    name=f'backfill_{i}.gif', content=SMALL_GIF,
+                    content_type='image/gif'
+                ),
+            )
+            for i in range(2)
+        ]
+        thumbnails.resolved.clear()
+
+    def test_generates_only_missing(self):
+        ready, missing = self.posts
+        thumbnails.generate(ready.image.name)
+        self.assertFalse(thumbnails.ready(missing.image))
+        out = StringIO()
+        with mock.patch.object(
+            thumbnails, 'generate', wraps=thumbnails.generate
+        ) as generate:
+            call_command('backfill_thumbnails', '--workers', '0', stdout=out)
+        generate.assert_called_once_with(missing.image.name)
+        self.assertTrue(thumbnails.ready(missing.image))
+        self.assertIn('Картинок: 1, с ошибками: 0, уже готовых: 1',
+                      out.getvalue())
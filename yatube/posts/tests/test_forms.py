@@ -1,14 +1,17 @@
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image, features
 
 from posts.models import Group, Post, Comment
 from posts.forms import PostForm
+from posts.images import normalize
 
 
 User = get_user_model()
@@ -117,7 +120,55 @@ class PostCreateFormTests(TestCase):
         post = Post.objects.get(id=self.post.pk)
         self.assertEqual(post.text, 'text_after_edit')
         self.assertEqual(post.group, self.group_2)
-        self.assertEqual(post.image, f'posts/{another_image.name}')
+        # Загруженная картинка перекодируется, имя сохраняет основу
+        self.assertTrue(post.image.name.startswith('posts/another_small.'))
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+
+    @override_settings(POSTS_IMAGE_MAX_SIZE=(40, 40))
+    def test_image_normalized_on_upload(self):
+        """Картинка поворачивается по EXIF, ужимается и теряет EXIF."""
+        source = Image.new('RGB', (100, 50), color=(255, 0, 0))
+        exif = Image.Exif()
+        # Orientation = 6: снимок нужно повернуть на 90° по часовой
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        source.save(buffer, 'JPEG', exif=exif.tobytes())
+        upload = SimpleUploadedFile(
+            name='photo.jpeg',
+            content=buffer.getvalue(),
+            content_type='image/jpeg'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'photo post', 'image': upload},
+        )
+        post = Post.objects.get(text='photo post')
+        self.assertEqual((post.image_width, post.image_height), (20, 40))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (20, 40))
+            self.assertNotIn('exif', stored.info)
+
+    def test_normalized_image_drops_metadata(self):
+        """В сохранённой картинке нет EXIF и ICC ни в одном формате."""
+        formats = {'JPEG': 'RGB', 'PNG': 'RGBA'}
+        if features.check('webp'):
+            formats['WEBP'] = 'RGBA'
+        exif = Image.Exif()
+        exif[271] = 'SecretCam'
+        for image_format, mode in formats.items():
+            with self.subTest(image_format=image_format), override_settings(
+                POSTS_IMAGE_FORMAT=image_format
+            ):
+                buffer = BytesIO()
+                Image.new(mode, (10, 10)).save(
+                    buffer, 'PNG', exif=exif.tobytes(), icc_profile=b'icc'
+                )
+                upload = SimpleUploadedFile('secret.png', buffer.getvalue())
+                normalized, _ = normalize(upload)
+                with Image.open(normalized) as stored:
+                    self.assertEqual(stored.format, image_format)
+                    self.assertEqual(dict(stored.getexif()), {})
+                    self.assertNotIn('icc_profile', stored.info)
 
     def test_try_add_comments(self):
         """
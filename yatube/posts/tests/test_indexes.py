@@ -0,0 +1,112 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import timeline
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+FEED_TABLES = ('posts_post', 'posts_comment', 'posts_timelineentry')
+
+
+@override_settings(POSTS_FOLLOW_FEED='materialized')
+class FeedQueryPlanTest(TestCase):
+    """Ленты читаются по индексу и без сортировки во временном B-дереве.
+
+    Лента подписок в режиме 'join' сюда не входит: слияние постов
+    нескольких авторов через join по определению требует сортировки.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth_user')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test title',
+            description='test description',
+            slug='test-slug',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(12):
+            cls.post = Post.objects.create(
+                text=f'Test post {i}', author=cls.author, group=cls.group
+            )
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text=f'comment {i}'
+            )
+        timeline.rebuild()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def feed_urls(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:follow_index'),
+        ]
+        for url in list(urls):
+            page = self.client.get(url, {'cursor': ''}).context['page_obj']
+            urls.append(f'{url}?page=2')
+            urls.append(f'{url}?cursor={page.next_cursor()}')
+        urls.append(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        return urls
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_feed_queries_use_indexes(self):
+        for url in self.feed_urls():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if 'ORDER BY' not in sql or not any(
+                    table in sql for table in FEED_TABLES
+                ):
+                    continue
+                plan = self.explain(sql)
+                with self.subTest(url=url, sql=sql, plan=plan):
+                    self.assertFalse(
+                        [step for step in plan if 'TEMP B-TREE' in step]
+                    )
+                    self.assertFalse([
+                        step for step in plan
+                        if step.startswith('SCAN')
+                        and 'INDEX' not in step
+                    ])
+
+    @override_settings(POSTS_FOLLOW_FEED='merge')
+    def test_merge_feed_reads_covering_index(self):
+        page = self.client.get(
+            reverse('posts:follow_index')
+        ).context['page_obj']
+        for params in ({}, {'cursor': page.next_cursor()}):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('posts:follow_index'), params)
+            merge = [
+                query['sql'] for query in queries.captured_queries
+                if 'CAST(pub_date AS TEXT)' in query['sql']
+            ]
+            self.assertEqual(len(merge), 1)
+            plan = self.explain(merge[0])
+            with self.subTest(params=params, plan=plan):
+                self.assertFalse(
+                    [step for step in plan if 'TEMP B-TREE' in step]
+                )
+                self.assertTrue([
+                    step for step in plan
+                    if 'COVERING INDEX post_author_date_idx' in step
+                ])
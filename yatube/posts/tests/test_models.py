@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from posts.models import Group, Post
+from posts.models import Comment, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -32,3 +35,47 @@ class PostModelTest(TestCase):
         group = PostModelTest.group
         expected_object_name = group.title
         self.assertEqual(expected_object_name, str(group))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def assertStats(self, user, posts, followers, following):
+        stats = UserStats.objects.get(user=user)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count, stats.following_count),
+            (posts, followers, following)
+        )
+
+    def test_counters_track_changes(self):
+        """Счётчики обновляются при создании и удалении объектов."""
+        post = Post.objects.create(author=self.author, text='text')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='comment'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertStats(self.author, 1, 1, 0)
+        self.assertStats(self.reader, 0, 0, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.stats.comments_count, 1)
+
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.stats.comments_count, 0)
+        self.assertStats(self.reader, 0, 0, 0)
+        post.delete()
+        self.assertStats(self.author, 0, 0, 0)
+
+    def test_recount_repairs_drift(self):
+        """manage.py recount восстанавливает счётчики после bulk_create."""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'text {i}') for i in range(3)
+        )
+        self.assertStats(self.author, 0, 0, 0)
+        call_command('recount', stdout=StringIO())
+        self.assertStats(self.author, 3, 0, 0)
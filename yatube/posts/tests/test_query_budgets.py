@@ -0,0 +1,181 @@
+import shutil
+import tempfile
+from importlib import import_module
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import thumbnails
+from posts import views
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+# Приложения, все маршруты которых обходит тест.
+URLCONFS = ('posts.urls', 'users.urls', 'about.urls')
+
+# Сколько запросов к БД может сделать страница на холодном кэше:
+# (анонимно, авторизованным пользователем). Новый маршрут без записи
+# здесь роняет тест. Авторизованный запрос читает сессию и пользователя,
+# страница с картинками — KV миниатюр одним get_many.
+QUERY_BUDGETS = {
+    'posts:index': (3, 5),
+    'posts:group_list': (4, 6),
+    'posts:profile': (3, 5),
+    'posts:search': (3, 5),
+    'posts:post_detail': (3, 5),
+    'posts:post_create': (0, 5),
+    'posts:post_edit': (0, 4),
+    'posts:comments': (1, 3),
+    'posts:add_comment': (0, 5),
+    'posts:follow_index': (0, 5),
+    'posts:profile_follow': (0, 6),
+    'posts:profile_unfollow': (0, 8),
+    'users:signup': (0, 2),
+    'users:logout': (0, 4),
+    'users:login': (0, 2),
+    'about:author': (0, 2),
+    'about:tech': (0, 2),
+}
+
+# Размеры страниц, при которых число запросов должно совпадать.
+PAGE_SIZES = (2, 5)
+
+
+def routes():
+    """(имя маршрута, имена его аргументов) из всех URLCONFS."""
+    for urlconf in URLCONFS:
+        module = import_module(urlconf)
+        for pattern in module.urlpatterns:
+            yield (
+                f'{module.app_name}:{pattern.name}',
+                list(pattern.pattern.converters),
+            )
+
+
+def image(name):
+    return SimpleUploadedFile(
+        name=name, content=SMALL_GIF, content_type='image/gif'
+    )
+
+
+# Пул миниатюр не запускается (on_commit в TestCase не срабатывает):
+# у постов есть и готовые миниатюры, и ещё не подготовленные.
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=2)
+class QueryBudgetTest(TestCase):
+    """Каждая страница укладывается в свой бюджет запросов к БД.
+
+    Число запросов не должно зависеть и от размера страницы: иначе
+    где-то в шаблоне идёт запрос на каждый объект. У всех постов есть
+    картинки, так что замеры проходят и через миниатюры с srcset.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='auth_user')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test title',
+            description='test description',
+            slug='test-slug',
+        )
+        other_group = Group.objects.create(
+            title='other', description='other', slug='other-slug'
+        )
+        commenters = [cls.reader] + [
+            User.objects.create_user(username=f'commenter_{i}')
+            for i in range(3)
+        ]
+        for i in range(12):
+            author = cls.author if i % 2 else commenters[i % 4]
+            group = cls.group if i % 3 else other_group
+            post = Post.objects.create(
+                text=f'test post {i}', author=author, group=group,
+                image=image(f'post_{i}.gif'),
+            )
+            if i % 4 < 2:
+                thumbnails.generate(post.image.name)
+        cls.post = Post.objects.create(
+            text='test post', author=cls.author, group=cls.group,
+            image=image('detail.gif'),
+        )
+        for i in range(12):
+            Comment.objects.create(
+                post=cls.post, author=commenters[i % 4], text=f'comment {i}'
+            )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for commenter in commenters[1:]:
+            Follow.objects.create(user=cls.reader, author=commenter)
+
+    def url_for(self, name, arguments):
+        values = {
+            'post_id': self.post.pk,
+            'username': self.author.username,
+            'slug': self.group.slug,
+        }
+        url = reverse(name, kwargs={key: values[key] for key in arguments})
+        if name == 'posts:search':
+            url += '?q=test'
+        return url
+
+    def count_queries(self, url, user, page_size):
+        cache.clear()
+        thumbnails.resolved.clear()
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        # Запрос может менять данные (подписка, выход): откатываем его,
+        # чтобы следующие замеры шли на тех же данных.
+        with mock.patch.object(views, 'COUNT_PUB', page_size), \
+                mock.patch.object(views, 'COMMENTS_PER_PAGE', page_size), \
+                transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                client.get(url)
+            transaction.set_rollback(True)
+        return len(queries)
+
+    def test_every_route_has_a_budget(self):
+        names = {name for name, _ in routes()}
+        self.assertEqual(names, set(QUERY_BUDGETS))
+
+    def test_views_stay_within_budget(self):
+        for name, arguments in routes():
+            url = self.url_for(name, arguments)
+            budgets = QUERY_BUDGETS.get(name)
+            for user, budget in zip((None, self.reader), budgets or ()):
+                with self.subTest(url=url, user=user):
+                    counts = [
+                        self.count_queries(url, user, size)
+                        for size in PAGE_SIZES
+                    ]
+                    self.assertLessEqual(
+                        max(counts), budget,
+                        f'{name}: {counts[-1]} запросов при бюджете {budget}'
+                    )
+                    self.assertEqual(
+                        counts[0], counts[-1],
+                        f'{name}: число запросов растёт с размером страницы'
+                    )
@@ -1,14 +1,26 @@
+import os
 import shutil
 import tempfile
+from io import StringIO
+from unittest import mock
 
 from django.core.cache import cache
+from django.core.management import call_command
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.template.loader import render_to_string
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from posts.models import Post, Group, Follow
+from core import thumbnails
+from core.cache import SQLiteCache
+from posts import counters, feed_cache, merge_feed, search, timeline
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry,
+                          UserStats)
+from posts.paginators import AFTER, BEFORE, CursorPaginator, encode_cursor
 
 from posts.forms import PostForm
 
@@ -26,6 +38,22 @@ SMALL_GIF = (
 )
 
 
+def use_shared_cache(test):
+    """Ставит в 'default' общий кэш core.cache во временном файле.
+
+    ETag страниц отдаются только с ним; возвращает путь к файлу.
+    """
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+    location = os.path.join(directory, 'cache.sqlite3')
+    override = test.settings(CACHES={'default': {
+        'BACKEND': 'core.cache.SQLiteCache', 'LOCATION': location,
+    }})
+    override.enable()
+    test.addCleanup(override.disable)
+    return location
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostsViewsTests(TestCase):
     @classmethod
@@ -60,6 +88,8 @@ class PostsViewsTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        # Фрагменты лент переживают откат БД между тестами
+        cache.clear()
         # Создаем неавторизованный клиент
         self.guest_client = Client()
         # Создаем авторизованный клиент
@@ -187,15 +217,49 @@ class PostsViewsTests(TestCase):
     def test_cache_index_pages(self):
         """Проверяем работу кэша главной страницы."""
         first_view = self.authorized_client.get(reverse('posts:index'))
-        post_1 = Post.objects.get(pk=1)
-        post_1.text = 'Changed text'
-        post_1.save()
+        # Обновление в обход сигналов кэш не сбрасывает.
+        Post.objects.filter(pk=self.post.pk).update(text='Changed text')
         second_view = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(first_view.content, second_view.content)
         cache.clear()
         third_view = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(first_view.content, third_view.content)
 
+    def test_feed_cache_invalidated_by_signals(self):
+        """Сохранение поста сразу видно во всех его лентах."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.post.author}),
+        )
+        for url in urls:
+            self.guest_client.get(url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Changed text'
+        post.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'Changed text')
+
+    def test_feed_cache_follows_group_change(self):
+        """Пост, перенесённый в другую группу, уходит из старой ленты."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.assertContains(self.guest_client.get(url), self.post.text)
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = self.group_without_posts
+        post.save()
+        self.assertNotContains(self.guest_client.get(url), self.post.text)
+        post.group = self.group
+        post.save()
+
+    def test_feed_cache_survives_generation_eviction(self):
+        """Вытесненный счётчик поколения не оживляет старый фрагмент."""
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        before = feed_cache.version(feed_cache.INDEX)
+        cache.delete(f'{feed_cache.PREFIX}:{feed_cache.INDEX}')
+        self.assertNotEqual(before, feed_cache.version(feed_cache.INDEX))
+
     def test_authorized_client_follow(self):
         self.authorized_client.get(reverse(
             'posts:profile_follow',
@@ -247,6 +311,12 @@ class PaginatorViewsTest(TestCase):
                      group=cls.group)
             )
         Post.objects.bulk_create(cls.posts)
+        # bulk_create обходит сигналы: счётчики пересчитываем сами,
+        # как это делает import_posts.
+        counters.recount_users(User.objects.filter(pk=cls.author.pk))
+
+    def setUp(self):
+        cache.clear()
 
     def test_paginator(self):
         """Тест паджинатора."""
@@ -264,3 +334,739 @@ class PaginatorViewsTest(TestCase):
             response = self.client.get(tested_url, {'page': 2})
             self.assertEqual(len(response.context.get(
                 'page_obj').object_list), 3)
+
+    def test_cursor_paginator(self):
+        """Keyset-паджинация проходит ленту без пропусков и повторов."""
+        list_urls = {
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+        }
+        for tested_url in list_urls:
+            with self.subTest(tested_url=tested_url):
+                first = self.client.get(tested_url, {'cursor': ''})
+                first_page = first.context['page_obj']
+                self.assertEqual(len(first_page.object_list), 10)
+                self.assertFalse(first_page.has_previous())
+                second = self.client.get(
+                    tested_url, {'cursor': first_page.next_cursor()}
+                )
+                second_page = second.context['page_obj']
+                self.assertEqual(len(second_page.object_list), 3)
+                self.assertFalse(second_page.has_next())
+                seen = [post.pk for post in first_page.object_list]
+                seen += [post.pk for post in second_page.object_list]
+                self.assertEqual(
+                    seen,
+                    list(Post.objects.order_by('-pub_date', '-pk')
+                         .values_list('pk', flat=True))
+                )
+                back = self.client.get(
+                    tested_url, {'cursor': second_page.previous_cursor()}
+                )
+                self.assertEqual(
+                    list(back.context['page_obj'].object_list),
+                    list(first_page.object_list)
+                )
+
+    def test_cursor_paginator_bad_token(self):
+        """Битый курсор отдаёт первую страницу."""
+        response = self.client.get(reverse('posts:index'), {'cursor': '!!'})
+        self.assertEqual(
+            len(response.context['page_obj'].object_list), 10
+        )
+
+    def test_cursor_paginator_crafted_token(self):
+        """Собранный вручную курсор не роняет ленты: первая страница."""
+        post = Post.objects.first()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:comments', kwargs={'post_id': post.pk}),
+        )
+        cursors = (
+            encode_cursor(AFTER, '2020-13-45T00:00:00+00:00', 1),
+            encode_cursor(AFTER, '2020-01-01T00:00:00+00:00', 10 ** 23),
+            encode_cursor(BEFORE, '2020-01-01T00:00:00+00:00', -2 ** 64),
+            encode_cursor(AFTER, '2020-01-01T00:00:00', 1),
+        )
+        for url in urls:
+            for cursor in cursors:
+                with self.subTest(url=url, cursor=cursor):
+                    response = self.client.get(url, {'cursor': cursor})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertFalse(
+                        response.context.get(
+                            'page_obj', response.context.get('comments')
+                        ).has_previous()
+                    )
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.author)
+        self.client.force_login(reader)
+        with self.settings(POSTS_FOLLOW_FEED='merge'):
+            for cursor in cursors:
+                with self.subTest(engine='merge', cursor=cursor):
+                    response = self.client.get(
+                        reverse('posts:follow_index'), {'cursor': cursor}
+                    )
+                    self.assertEqual(response.status_code, 200)
+                    page = response.context['page_obj']
+                    self.assertFalse(page.has_previous())
+                    self.assertEqual(len(page), 10)
+
+    def test_cursor_paginator_skips_count(self):
+        """Страница по курсору выбирается одним запросом без COUNT."""
+        page = self.client.get(
+            reverse('posts:index'), {'cursor': ''}
+        ).context['page_obj']
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        with self.assertNumQueries(1):
+            paginator.get_page(page.next_cursor())
+
+
+class PostCardCacheTest(TestCase):
+    CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth_user')
+        cls.post = Post.objects.create(text='Test post', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cards_rendered_once(self):
+        """Карточки берутся из кэша, даже когда фрагмент ленты устарел."""
+        url = reverse('posts:index')
+        with self.assertTemplateUsed(template_name=self.CARD_TEMPLATE):
+            self.client.get(url)
+        feed_cache.bump(feed_cache.INDEX)
+        with self.assertTemplateNotUsed(template_name=self.CARD_TEMPLATE):
+            response = self.client.get(url)
+        self.assertContains(response, self.post.text)
+
+    def test_profile_uses_cards(self):
+        """Профиль показывает те же кэшируемые карточки, что и ленты."""
+        url = reverse('posts:profile', kwargs={'username': self.author})
+        with self.assertTemplateUsed(template_name=self.CARD_TEMPLATE):
+            self.client.get(url)
+        feed_cache.bump(feed_cache.author_feed(self.author.pk))
+        with self.assertTemplateNotUsed(template_name=self.CARD_TEMPLATE):
+            response = self.client.get(url)
+        self.assertContains(response, self.post.text)
+
+    def test_card_follows_post_and_author_changes(self):
+        url = reverse('posts:index')
+        self.client.get(url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Changed text'
+        post.save()
+        self.assertContains(self.client.get(url), 'Changed text')
+        author = User.objects.get(pk=self.author.pk)
+        author.username = 'renamed_user'
+        author.save()
+        self.assertContains(self.client.get(url), 'renamed_user')
+
+    def test_user_saves_keep_cards(self):
+        """Вход и смена пароля не сбрасывают кэш лент всего сайта."""
+        generation = feed_cache.generation(feed_cache.ALL)
+        author = User.objects.get(pk=self.author.pk)
+        author.set_password('new password')
+        author.save()
+        self.client.force_login(author)
+        self.assertEqual(feed_cache.generation(feed_cache.ALL), generation)
+        author.first_name = 'Лев'
+        author.save()
+        self.assertNotEqual(
+            feed_cache.generation(feed_cache.ALL), generation
+        )
+
+
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth_user')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test title',
+            description='test description',
+            slug='test-slug',
+        )
+        cls.post = Post.objects.create(
+            text='Test post', author=cls.author, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+
+    def test_anonymous_pages_served_without_queries(self):
+        for url in self.urls:
+            first = self.client.get(url)
+            with self.subTest(url=url), self.assertNumQueries(0):
+                second = self.client.get(url)
+                self.assertEqual(first.content, second.content)
+
+    def test_authorized_pages_not_cached(self):
+        self.client.force_login(self.reader)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.client.get(url)
+        self.assertIsNotNone(self.client.get(url).context)
+
+    def test_post_change_purges_pages(self):
+        for url in self.urls:
+            self.client.get(url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Changed text'
+        post.save()
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Changed text')
+
+    def test_comment_and_follow_purge_pages(self):
+        detail, profile = self.urls[3], self.urls[2]
+        self.client.get(detail)
+        self.client.get(profile)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='New comment'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertContains(self.client.get(detail), 'Комментариев: 1')
+        self.assertContains(self.client.get(profile), 'Подписчиков: 1')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth_user')
+        cls.group = Group.objects.create(
+            title='test title',
+            description='test description',
+            slug='test-slug',
+        )
+        cls.post = Post.objects.create(
+            text='Test post', author=cls.author, group=cls.group
+        )
+
+    def setUp(self):
+        self.cache_location = use_shared_cache(self)
+        cache.clear()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+
+    def test_not_modified(self):
+        """Неизменившаяся страница отдаётся 304 без запросов к БД."""
+        for url in self.urls:
+            etag = self.client.get(url)['ETag']
+            with self.subTest(url=url), self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_content(self):
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Changed text'
+        post.save()
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertContains(response, 'Changed text')
+
+    def test_etag_follows_other_processes(self):
+        """Сдвиг поколения через другой экземпляр кэша меняет ETag."""
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        other = SQLiteCache(self.cache_location, {})
+        with mock.patch.object(feed_cache, 'cache', other):
+            feed_cache.bump(feed_cache.ALL)
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_no_etag_without_shared_cache(self):
+        """С кэшем процесса (LocMemCache) ETag не отдаётся."""
+        locmem = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}
+        with self.settings(CACHES=locmem):
+            for url in self.urls:
+                with self.subTest(url=url):
+                    self.assertFalse(self.client.get(url).has_header('ETag'))
+
+    def test_etag_depends_on_viewer(self):
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class ProfileQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth_user')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test title',
+            description='test description',
+            slug='test-slug',
+        )
+        for i in range(15):
+            Post.objects.create(
+                text=f'Test post {i}', author=cls.author, group=cls.group
+            )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+        self.url = reverse('posts:profile', kwargs={'username': self.author})
+
+    def test_profile_query_count(self):
+        """Сессия, пользователь, автор и страница постов."""
+        for page in (1, 2):
+            cache.clear()
+            with self.subTest(page=page), self.assertNumQueries(4):
+                response = self.client.get(self.url, {'page': page})
+            self.assertTrue(response.context['is_following'])
+            self.assertEqual(response.context['page_obj'].paginator.count, 15)
+
+    def test_profile_count_from_stats(self):
+        """Шапка и паджинатор показывают один счётчик, без COUNT(*)."""
+        UserStats.objects.filter(user=self.author).update(posts_count=12)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 12)
+        self.assertContains(response, 'Всего постов: 12')
+        for query in queries:
+            self.assertNotIn('COUNT(', query['sql'])
+
+    def test_profile_not_following(self):
+        self.client.force_login(self.author)
+        self.assertFalse(self.client.get(self.url).context['is_following'])
+
+
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth_user')
+        cls.post = Post.objects.create(text='Test post', author=cls.author)
+        for i in range(25):
+            commenter = User.objects.create_user(username=f'reader_{i}')
+            Comment.objects.create(
+                post=cls.post, author=commenter, text=f'comment {i}'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+
+    def test_first_page_newest_first(self):
+        """Пост и страница комментариев с авторами: два запроса."""
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            [f'comment {i}' for i in range(24, 4, -1)]
+        )
+        self.assertTrue(comments.has_next)
+
+    def test_fragment_loads_next_page(self):
+        comments = self.client.get(self.url).context['comments']
+        response = self.client.get(
+            reverse('posts:comments', kwargs={'post_id': self.post.pk}),
+            {'cursor': comments.next_cursor()}
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            [f'comment {i}' for i in range(4, -1, -1)]
+        )
+        self.assertNotContains(response, 'js-more-comments')
+
+
+class FeedQueriesTest(TestCase):
+    """Число запросов ленты не зависит от числа постов на странице."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test title',
+            description='test description',
+            slug='test-slug',
+        )
+        cls.authors = [
+            User.objects.create_user(username=f'author_{i}')
+            for i in range(10)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def feed_urls(self):
+        return (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=Test',
+        )
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def add_posts(self, authors):
+        for author in authors:
+            Post.objects.create(
+                text='Test post', author=author, group=self.group
+            )
+
+    def test_feed_queries_constant(self):
+        for mode in ('join', 'materialized'):
+            with self.subTest(mode=mode), override_settings(
+                POSTS_FOLLOW_FEED=mode
+            ):
+                Post.objects.all().delete()
+                self.add_posts(self.authors[:1])
+                timeline.rebuild()
+                few = {
+                    url: self.count_queries(url) for url in self.feed_urls()
+                }
+                self.add_posts(self.authors[1:])
+                timeline.rebuild()
+                for url in self.feed_urls():
+                    self.assertEqual(self.count_queries(url), few[url], url)
+
+    def test_cards_render_without_queries(self):
+        self.add_posts(self.authors)
+        posts = list(Post.objects.for_feed())
+        with self.assertNumQueries(0):
+            for post in posts:
+                render_to_string(
+                    'posts/includes/post_card.html', {'post': post}
+                )
+
+
+@override_settings(POSTS_FOLLOW_FEED='materialized')
+class MaterializedFollowFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth_user')
+        cls.reader = User.objects.create_user(username='reader')
+        Post.objects.bulk_create(
+            Post(text=f'Test post {i}', author=cls.author) for i in range(3)
+        )
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def feed(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'].object_list)
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        self.reader_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author})
+        )
+        self.assertEqual(len(self.feed()), 3)
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.author})
+        )
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_new_post_fans_out_to_followers(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.author_client.post(
+            reverse('posts:post_create'), data={'text': 'fresh post'}
+        )
+        feed = self.feed()
+        self.assertEqual(len(feed), 4)
+        self.assertEqual(feed[0].text, 'fresh post')
+
+    def test_orm_writes_update_timeline(self):
+        """Записи мимо views (админка, shell) тоже попадают в ленты."""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(len(self.feed()), 3)
+        Post.objects.create(text='from admin', author=self.author)
+        self.assertEqual(self.feed()[0].text, 'from admin')
+        follow.delete()
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_rebuild_command(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(
+            [post.pk for post in self.feed()],
+            list(self.author.posts.order_by('-pub_date', '-pk')
+                 .values_list('pk', flat=True))
+        )
+
+
+@override_settings(POSTS_FOLLOW_FEED='merge')
+class MergeFollowFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author_{i}')
+            for i in range(5)
+        ]
+        stranger = User.objects.create_user(username='stranger')
+        # Посты распределены неравномерно, у двух авторов их нет вовсе.
+        for i in range(30):
+            Post.objects.create(
+                text=f'Test post {i}', author=cls.authors[i * i % 5]
+            )
+        Post.objects.create(text='Not followed', author=stranger)
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+        self.expected = list(Post.objects.filter(
+            author__following__user=self.reader
+        ))
+
+    def walk(self):
+        pages = []
+        page = self.client.get(reverse('posts:follow_index')).context[
+            'page_obj'
+        ]
+        pages.append(page)
+        while page.has_next():
+            page = self.client.get(
+                reverse('posts:follow_index'), {'cursor': page.next_cursor()}
+            ).context['page_obj']
+            pages.append(page)
+        return pages
+
+    def test_pages_match_join_feed(self):
+        for chunk_size in (100, 2):
+            with self.subTest(chunk_size=chunk_size), mock.patch.object(
+                merge_feed, 'CHUNK_SIZE', chunk_size
+            ):
+                pages = self.walk()
+                self.assertEqual(
+                    [post for page in pages for post in page],
+                    self.expected
+                )
+                back = self.client.get(
+                    reverse('posts:follow_index'),
+                    {'cursor': pages[-1].previous_cursor()}
+                ).context['page_obj']
+                self.assertEqual(
+                    list(back.object_list), list(pages[-2].object_list)
+                )
+
+    def test_query_count_bounded(self):
+        """Подписки, ключи одним UNION ALL и посты страницы."""
+        url = reverse('posts:follow_index')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        feed = [
+            query['sql'] for query in queries.captured_queries
+            if 'posts_post' in query['sql']
+        ]
+        self.assertEqual(len(feed), 2)
+
+    def test_benchmark_command_rolls_back(self):
+        posts = Post.objects.count()
+        out = StringIO()
+        call_command(
+            'benchmark_follow_feed', '--follows', '3', '--pages', '1',
+            '--posts-per-author', '2', '--repeat', '1', stdout=out
+        )
+        self.assertIn('merge', out.getvalue())
+        self.assertEqual(Post.objects.count(), posts)
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='leo_tolstoy')
+        cls.group = Group.objects.create(
+            title='Классика',
+            description='test description',
+            slug='classic',
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Война и мир, том {i}',
+                author=cls.author,
+                group=cls.group,
+            )
+            for i in range(13)
+        ]
+        cls.other = Post.objects.create(
+            text='Совсем другой текст',
+            author=User.objects.create_user(username='someone'),
+        )
+
+    def found(self, query, **params):
+        response = self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+        return response.context['page_obj']
+
+    def test_search_by_text_author_and_group(self):
+        """Поиск находит посты по тексту, автору и группе."""
+        for query in ('война', 'мир том', 'leo', 'классика'):
+            with self.subTest(query=query):
+                page = self.found(query)
+                self.assertEqual(len(page.object_list), 10)
+                self.assertNotIn(self.other, page.object_list)
+
+    def test_search_cursor_pages(self):
+        """Выдача поиска листается курсором без повторов."""
+        first = self.found('война')
+        second = self.found('война', cursor=first.next_cursor())
+        self.assertFalse(second.has_next())
+        found = list(first.object_list) + list(second.object_list)
+        self.assertEqual(set(found), set(self.posts))
+        back = self.found('война', cursor=second.previous_cursor())
+        self.assertEqual(list(back.object_list), list(first.object_list))
+
+    def test_search_index_follows_changes(self):
+        """Индекс обновляется при изменении и удалении поста."""
+        self.other.text = 'Анна Каренина'
+        self.other.save()
+        self.assertEqual(list(self.found('каренина')), [self.other])
+        self.other.delete()
+        self.assertEqual(list(self.found('каренина')), [])
+
+    def test_author_reindexed_only_on_rename(self):
+        """Вход и смена пароля не переиндексируют посты автора."""
+        author = User.objects.get(pk=self.author.pk)
+        with mock.patch.object(
+            search, 'get_backend', wraps=search.get_backend
+        ) as get_backend:
+            author.set_password('new password')
+            author.save()
+            author.first_name = 'Лев'
+            author.save()
+            self.client.force_login(author)
+            get_backend.assert_not_called()
+            author.username = 'tolstoy_lev'
+            author.save()
+            get_backend.assert_called_once()
+        self.assertEqual(len(self.found('tolstoy').object_list), 10)
+
+    def test_search_syntax_is_escaped(self):
+        """Операторы FTS5 во вводе не ломают запрос."""
+        response = self.client.get(
+            reverse('posts:search'), {'q': '"война" OR NEAR( *'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_rebuild_search_index(self):
+        """Команда переиндексации подхватывает посты из bulk_create."""
+        Post.objects.bulk_create([
+            Post(text='Воскресение', author=self.author),
+        ])
+        self.assertEqual(list(self.found('воскресение')), [])
+        call_command(
+            'rebuild_search_index', chunk_size=5, stdout=StringIO()
+        )
+        self.assertEqual(len(self.found('воскресение')), 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=2)
+class ThumbnailCompletionTest(TestCase):
+    """Страницы, отрисованные до готовности миниатюр, не застревают."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth_user')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test title',
+            description='test description',
+            slug='test-slug',
+        )
+        # on_commit в TestCase не срабатывает: миниатюр пока нет
+        cls.post = Post.objects.create(
+            text='Test post', author=cls.author, group=cls.group,
+            image=SimpleUploadedFile(
+                name='pending.gif', content=SMALL_GIF,
+                content_type='image/gif'
+            ),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        thumbnails.resolved.clear()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+
+    def assertThumbnailsShown(self, client, shown):
+        for url in self.urls:
+            with self.subTest(url=url, shown=shown):
+                response = client.get(url)
+                if shown:
+                    self.assertContains(response, 'srcset="')
+                else:
+                    self.assertNotContains(response, 'srcset="')
+
+    def test_feed_fragments_pick_up_thumbnails(self):
+        self.client.force_login(self.reader)
+        self.assertThumbnailsShown(self.client, False)
+        thumbnails.generate(self.post.image.name)
+        self.assertThumbnailsShown(self.client, True)
+
+    def test_anonymous_pages_pick_up_thumbnails(self):
+        self.assertThumbnailsShown(self.client, False)
+        thumbnails.generate(self.post.image.name)
+        self.assertThumbnailsShown(self.client, True)
+
+    def test_etag_changes_when_thumbnails_ready(self):
+        use_shared_cache(self)
+        self.client.force_login(self.reader)
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        thumbnails.generate(self.post.image.name)
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'srcset="')
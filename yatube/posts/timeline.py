@@ -0,0 +1,117 @@
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import F
+
+from .models import Follow, Post, TimelineEntry
+
+
+BATCH_SIZE: int = 500
+
+# Ключи keyset-паджинации материализованной ленты.
+KEYS = ('feed_date', 'feed_post')
+
+
+def is_materialized():
+    """Лента подписок читается из TimelineEntry, а не через join."""
+    return settings.POSTS_FOLLOW_FEED == 'materialized'
+
+
+def feed_for(user):
+    """Посты ленты пользователя в порядке индекса TimelineEntry.
+
+    Сортировка и курсор идут по аннотациям над уже присоединённой
+    строкой ленты: повторный filter() по обратной связи добавил бы
+    в запрос ещё один JOIN.
+    """
+    return Post.objects.filter(
+        timeline_entries__user=user
+    ).for_feed().annotate(
+        feed_date=F('timeline_entries__pub_date'),
+        feed_post=F('timeline_entries__post'),
+    ).order_by('-feed_date', '-feed_post')
+
+
+def _insert(entries):
+    """Пишет записи ленты пачками, не держа в памяти весь поток."""
+    written = 0
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, BATCH_SIZE))
+        if not batch:
+            return written
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        written += len(batch)
+
+
+def fan_out(post):
+    """Раскладывает новый пост в ленты всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    _insert(
+        TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def fan_out_many(posts):
+    """Раскладывает пачку новых постов в ленты подписчиков их авторов.
+
+    Подписчики всех авторов читаются одним запросом, посты — потоком.
+    """
+    followers = defaultdict(list)
+    for user_id, author_id in Follow.objects.filter(
+        author__in=posts.values('author_id')
+    ).values_list('user_id', 'author_id').iterator():
+        followers[author_id].append(user_id)
+    rows = posts.order_by().values_list('pk', 'author_id', 'pub_date')
+    return _insert(
+        TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+        for pk, author_id, pub_date in rows.iterator()
+        for user_id in followers[author_id]
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту пользователя все посты нового автора."""
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('pk', 'pub_date')
+    _insert(
+        TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+        for pk, pub_date in posts.iterator()
+    )
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты пользователя посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def rebuild(users=None):
+    """Пересобирает ленты заданных (или всех) пользователей.
+
+    Возвращает число обработанных строк.
+    """
+    entries = TimelineEntry.objects.all()
+    follows = Follow.objects.all()
+    if users is not None:
+        entries = entries.filter(user__in=users)
+        follows = follows.filter(user__in=users)
+    entries.delete()
+    written = 0
+    for user_id, author_id in follows.values_list(
+        'user_id', 'author_id'
+    ).iterator():
+        posts = Post.objects.filter(
+            author_id=author_id
+        ).values_list('pk', 'pub_date')
+        written += _insert(
+            TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts.iterator()
+        )
+    return written
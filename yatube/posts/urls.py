@@ -11,12 +11,17 @@ urlpatterns = [
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     # Профайл пользователя
     path('profile/<str:username>/', views.profile, name='profile'),
+    # Поиск
+    path('search/', views.search_posts, name='search'),
     # Просмотр записи
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     # Создание поста
     path('create/', views.post_create, name='post_create'),
     # Редактирование поста
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    # Следующая страница комментариев (HTML-фрагмент)
+    path('posts/<int:post_id>/comments/', views.post_comments,
+         name='comments'),
     # Добавление комментариев
     path('posts/<int:post_id>/comment/', views.add_comment,
          name='add_comment'),
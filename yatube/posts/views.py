@@ -1,77 +1,136 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.shortcuts import render, get_object_or_404, redirect
+from django.views.decorators.http import condition
 
-from .models import Post, Group, User, Follow
+from .models import Comment, Post, Group, User, Follow
 
 from .forms import CommentForm, PostForm
+from . import counters, etags, feed_cache, merge_feed, search, timeline
+from .page_cache import cache_anonymous_page, tag
+from .paginators import CursorPaginator, paginate
 
 
 COUNT_PUB: int = 10
+COMMENTS_PER_PAGE: int = 20
 
 
+@condition(etag_func=etags.index)
+@cache_anonymous_page
 def index(request):
-    posts = Post.objects.select_related('author', 'group').all()
-    paginator = Paginator(posts, COUNT_PUB)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    tag(request, feed_cache.INDEX)
+    posts = Post.objects.for_feed()
+    page_obj = paginate(request, posts, COUNT_PUB)
     context = {
         'page_obj': page_obj,
+        **feed_cache.context(feed_cache.INDEX),
     }
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=etags.group_posts)
+@cache_anonymous_page
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('group', 'author').all()
-    paginator = Paginator(posts, COUNT_PUB)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    tag(request, feed_cache.group_feed(group.pk))
+    posts = group.posts.for_feed()
+    page_obj = paginate(request, posts, COUNT_PUB)
     context = {
         'group': group,
         'page_obj': page_obj,
+        **feed_cache.context(feed_cache.group_feed(group.pk)),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@condition(etag_func=etags.profile)
+@cache_anonymous_page
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.select_related('author').all()
-    paginator = Paginator(posts, COUNT_PUB)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    is_following = (request.user.is_authenticated
-                    and request.user != author
-                    and Follow.objects.filter(
-                        user=request.user,
-                        author=author
-                    ).exists())
+    # Автор, его счётчики и подписка зрителя — одним запросом.
+    authors = User.objects.select_related('stats')
+    if request.user.is_authenticated:
+        authors = authors.annotate(is_following=Exists(
+            Follow.objects.filter(user=request.user, author=OuterRef('pk'))
+        ))
+    author = get_object_or_404(authors, username=username)
+    tag(request, feed_cache.author_feed(author.pk))
+    author_stats = counters.user_stats(author)
+    posts = author.posts.for_feed()
+    # Шапка и паджинатор берут число постов из одного счётчика
+    # UserStats, пришедшего вместе с автором: COUNT(*) не нужен.
+    page_obj = paginate(
+        request, posts, COUNT_PUB, count=author_stats.posts_count
+    )
     template = 'posts/profile.html'
     context = {
         'author': author,
+        'author_stats': author_stats,
         'page_obj': page_obj,
-        'is_following': is_following,
+        'is_following': getattr(author, 'is_following', False),
+        **feed_cache.context(feed_cache.author_feed(author.pk)),
     }
     return render(request, template, context)
 
 
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        paginator = search.SearchPaginator(query, COUNT_PUB)
+        page_obj = paginator.get_page(request.GET.get('cursor'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@condition(etag_func=etags.post_detail)
+@cache_anonymous_page
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group', 'stats'),
+        pk=post_id
+    )
+    tag(request, feed_cache.post_feed(post.pk),
+        feed_cache.author_feed(post.author_id))
     author = post.author
-    post_count = author.posts.count()
+    post_count = counters.user_stats(author).posts_count
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
     context = {
         'post': post,
         'author': author,
         'post_count': post_count,
         'form': form,
-        'comments': comments,
+        'comments': comments_page(request, post.pk),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comments_page(request, post_id):
+    """Страница комментариев поста, от новых к старым, по курсору."""
+    paginator = CursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        COMMENTS_PER_PAGE,
+        keys=('created', 'pk')
+    )
+    return paginator.get_page(request.GET.get('cursor'))
+
+
+@cache_anonymous_page
+def post_comments(request, post_id):
+    """HTML-фрагмент со следующей страницей комментариев."""
+    tag(request, feed_cache.post_feed(post_id))
+    context = {
+        'post_id': post_id,
+        'comments': comments_page(request, post_id),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(
         request.POST or None,
@@ -109,6 +168,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
@@ -122,16 +182,24 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    username = request.user
-    post = Post.objects.filter(author__following__user=username)
-    paginator = Paginator(post, COUNT_PUB)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if timeline.is_materialized():
+        post = timeline.feed_for(request.user)
+        page_obj = paginate(request, post, COUNT_PUB, timeline.KEYS)
+    elif merge_feed.is_enabled():
+        paginator = merge_feed.MergeFeedPaginator(request.user, COUNT_PUB)
+        page_obj = paginator.get_page(request.GET.get('cursor'))
+    else:
+        username = request.user
+        post = Post.objects.filter(
+            author__following__user=username
+        ).for_feed()
+        page_obj = paginate(request, post, COUNT_PUB)
     context = {'page_obj': page_obj}
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     if username != request.user.username:
         author = get_object_or_404(User, username=username)
@@ -143,6 +211,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     # Дизлайк, отписка
     follow = Follow.objects.filter(
@@ -33,6 +33,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.timing.ServerTimingMiddleware',
+    'core.slow_queries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -128,5 +131,132 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    # Общий для всех процессов машины кэш без внешних сервисов
+    # (core.cache). При нескольких воркерах его ставят в 'default',
+    # иначе сброс кэша в одном процессе не доходит до остальных: кэши
+    # лент живут недолго (см. POSTS_FEED_CACHE_TTL), а страницы
+    # отдаются без ETag (posts.etags). Файл
+    # LOCATION создаётся при первом обращении к кэшу.
+    'shared': {
+        'BACKEND': 'core.cache.TieredSQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'L1_TIMEOUT': 2,
+            'L1_MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+
+# Режим паджинации лент по умолчанию: 'offset' (?page=N) или
+# 'cursor' (?cursor=<token>, keyset по pub_date и id).
+POSTS_PAGINATION = 'offset'
+
+# Источник ленты подписок: 'join' (Post x Follow на лету),
+# 'materialized' (таблица TimelineEntry, заполняется при публикации)
+# или 'merge' (слияние индексных диапазонов авторов, posts.merge_feed).
+# После включения 'materialized' выполните manage.py rebuild_timelines.
+POSTS_FOLLOW_FEED = 'join'
+
+# Бэкенд поиска по постам: FTS5 требует SQLite, на других СУБД
+# используйте 'posts.search.SimpleSearchBackend'.
+POSTS_SEARCH_BACKEND = 'posts.search.FTS5SearchBackend'
+
+# Миниатюры готовятся заранее, при загрузке картинки, в фоновом пуле
+# из THUMBNAIL_WORKERS потоков (0 — синхронно, в том же запросе).
+# pytest ставит 0 в conftest.py: воркер пула не должен писать во
+# временный MEDIA_ROOT, который тест уже удаляет.
+THUMBNAIL_BACKEND = 'core.thumbnails.ThumbnailBackend'
+
+THUMBNAIL_PRESETS = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+
+THUMBNAIL_WORKERS = 2
+
+# Ширины вариантов для srcset: готовятся для каждого пресета
+# с сохранением его пропорций.
+THUMBNAIL_SRCSET_WIDTHS = (320, 640, 960, 1440)
+
+THUMBNAIL_SRCSET_SIZES = '(max-width: 960px) 100vw, 960px'
+
+# KV-хранилище с пакетным get_many и размер LRU найденных миниатюр
+THUMBNAIL_KVSTORE = 'core.thumbnails.KVStore'
+
+THUMBNAIL_LRU_SIZE = 2048
+
+# Нормализация картинок постов при загрузке: максимальные размеры,
+# формат хранения (WebP, если Pillow собран с libwebp) и качество.
+POSTS_IMAGE_MAX_SIZE = (1920, 1920)
+
+POSTS_IMAGE_FORMAT = 'WEBP'
+
+POSTS_IMAGE_QUALITY = 85
+
+# Актуальность кэшей лент обеспечивают поколения из posts.feed_cache,
+# которые сигналы сдвигают в кэше 'default'. Пока он свой у каждого
+# процесса (LocMemCache), сдвиг не доходит до других воркеров, и их
+# отставание ограничивает только TTL — короткий, как до поколений.
+# С общим кэшем (core.cache) TTL лишь ограничивает память.
+_SHARED_CACHE = CACHES['default']['BACKEND'].startswith('core.cache.')
+
+_FEED_TTL = 60 * 60 * 24 if _SHARED_CACHE else 20
+
+# Время жизни фрагментов лент.
+POSTS_FEED_CACHE_TTL = _FEED_TTL
+
+# Время жизни отрисованных карточек постов; ключ карточки меняется
+# вместе с updated_at поста и поколением авторов и групп.
+POSTS_CARD_CACHE_TTL = _FEED_TTL
+
+# Время жизни страниц, закэшированных для анонимных читателей
+# (posts.page_cache).
+POSTS_PAGE_CACHE_TTL = _FEED_TTL
+
+# Доля запросов, для которых core.timing замеряет БД, шаблоны, кэш
+# и миниатюры (заголовок Server-Timing и лог core.timing); 0 — выключено.
+SERVER_TIMING_SAMPLE_RATE = 0.0
+
+# Файл SQLite, в котором core.metrics копит метрики всех процессов
+# машины для /metrics (формат Prometheus); None — метрики выключены.
+METRICS_DATABASE = None
+
+# Токен для сборщика метрик: /metrics отдаётся по заголовку
+# Authorization: Bearer <токен> и сотрудникам; None — только сотрудникам.
+METRICS_TOKEN = None
+
+# Журнал медленных запросов (core.slow_queries): файл SQLite и порог
+# в миллисекундах; None — журнал выключен. Сводка: manage.py slow_queries.
+SLOW_QUERY_LOG = None
+
+SLOW_QUERY_THRESHOLD_MS = 100
+
+# Дописывать ли к образцу запроса значения параметров. В них бывают
+# ключи сессий, хэши паролей и личные данные: включайте только для
+# отладки на своей машине.
+SLOW_QUERY_LOG_PARAMS = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'core.slow_queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }